@@ -3,12 +3,216 @@ import logging  # Importa el módulo logging para registrar eventos y mensajes.
 from binance.exceptions import BinanceAPIException
 # Importa el módulo math para funciones matemáticas como floor y log10.
 import math
+# Importa el módulo time para controlar la caducidad de la caché de filtros.
+import time
+# Importa functools para conservar el nombre y la documentación de las funciones decoradas.
+import functools
+# Importa threading para proteger el limitador de peso de la API compartido entre hilos.
+import threading
+# Importa atexit para cerrar la sesión del cliente asíncrono al terminar el proceso.
+import atexit
+# Importa namedtuple para los filtros de símbolo (acceso por nombre y desempaquetado como tupla).
+from collections import namedtuple
+# Importa Decimal para comparar cantidades y valores nocionales sin errores de redondeo binario.
+from decimal import Decimal
+# Importa asyncio para descargar velas de varios símbolos de forma concurrente.
+import asyncio
+# Importa el cliente asíncrono de Binance.
+from binance import AsyncClient
+# Importa el conversor de intervalos de velas ("1m", "1h"...) a milisegundos.
+from binance.helpers import interval_to_milliseconds
+# Importa el pool de hilos para lanzar consultas independientes a la vez.
+from concurrent.futures import ThreadPoolExecutor
+# Importa el adaptador HTTP de requests para ampliar el pool de conexiones del cliente.
+from requests.adapters import HTTPAdapter
 
 # Configura el sistema de registro básico para este módulo.
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Tiempo de vida (en segundos) de los filtros de símbolo cacheados. Los filtros de Binance
+# (LOT_SIZE, MIN_NOTIONAL/NOTIONAL, PRICE_FILTER) cambian muy raramente: se refrescan una vez al día.
+FILTERS_CACHE_TTL = 24 * 3600
+# Filtros de trading de un símbolo parseados de la información del exchange.
+SymbolFilters = namedtuple(
+    'SymbolFilters', ['step_size', 'min_qty', 'min_notional', 'tick_size'])
+# Datos de mercado de un símbolo tomados a la vez para decidir y ejecutar una compra.
+MarketSnapshot = namedtuple('MarketSnapshot', ['precio', 'saldo_usdt', 'filtros'])
+# Caché de filtros por símbolo: {symbol: (timestamp_expiracion, SymbolFilters)}.
+_filters_cache = {}
+# Tiempo de vida (en segundos) de los precios y saldos cacheados: suficiente para compartir la consulta
+# dentro de una misma decisión de trading, pero siempre se refresca entre operaciones.
+PRECIO_SALDO_CACHE_TTL = 1.0
+# Número máximo de peticiones de velas simultáneas, para no agotar el peso de la API de Binance.
+MAX_DESCARGAS_CONCURRENTES = 20
+# Máximo de velas que devuelve Binance en una sola petición a /klines.
+MAX_VELAS_POR_PETICION = 1000
+# Conexiones HTTP reutilizables por host en la sesión del cliente de Binance. El pool por defecto
+# de requests (10) se queda corto con los hilos que calculan indicadores en paralelo.
+HTTP_POOL_MAXSIZE = 50
+HTTP_POOL_CONNECTIONS = 10
+# Límite de peso de peticiones REST de Binance por minuto (por IP).
+API_PESO_POR_MINUTO = 1200
+# Peso de una petición a /api/v3/klines.
+PESO_KLINES = 2
+
+# Límite de órdenes nuevas de Binance (10/s); se usa 9/s de margen con ráfagas de hasta 10.
+ORDENES_POR_SEGUNDO = 9.0
+ORDENES_RAFAGA = 10
+
+# Token bucket del peso de la API: [peso_disponible, ultimo_timestamp], protegido por un lock.
+_peso_api = [float(API_PESO_POR_MINUTO), time.time()]
+_peso_api_lock = threading.Lock()
+# Token bucket de las órdenes: [ordenes_disponibles, ultimo_timestamp], protegido por un lock.
+_ordenes_api = [float(ORDENES_RAFAGA), time.time()]
+_ordenes_api_lock = threading.Lock()
+
+# Bucle de eventos persistente (en un hilo daemon) y AsyncClient compartido por todas las descargas
+# concurrentes de velas; se crean bajo demanda con el primer barrido.
+_bucle_descargas = None
+_async_client = None
+_async_lock = threading.Lock()
+
+# Hilos para consultar_en_paralelo (cada llamada lanza unas pocas consultas: precio, saldo, filtros).
+MAX_WORKERS_CONSULTAS = 8
+_executor_consultas = ThreadPoolExecutor(max_workers=MAX_WORKERS_CONSULTAS)
+
+
+def ttl_cache(ttl):
+    """
+    Decorador que cachea el resultado de una función durante 'ttl' segundos por combinación de argumentos.
+    La función decorada expone cache_clear() para invalidar la caché (p. ej. tras ejecutar una orden)
+    y cache_put(valor, client, *args) para guardar un valor obtenido por otra vía (p. ej. de las velas).
+    Los resultados que evalúan a falso (p. ej. el 0.0 que devuelven las consultas ante un error) no se
+    cachean: un fallo puntual no debe propagarse a todas las llamadas de la ventana.
+
+    Args:
+        ttl (float): Segundos durante los que se reutiliza un resultado.
+    """
+    def decorador(func):
+        # Caché: {argumentos: (timestamp_expiracion, valor)}.
+        cache = {}
+
+        @functools.wraps(func)
+        def envoltorio(client, *args):
+            clave = (id(client),) + args
+            ahora = time.time()
+            cacheado = cache.get(clave)
+            if cacheado and cacheado[0] > ahora:
+                return cacheado[1]
+            valor = func(client, *args)
+            if valor:
+                cache[clave] = (ahora + ttl, valor)
+            return valor
+
+        def cache_put(valor, client, *args):
+            cache[(id(client),) + args] = (time.time() + ttl, valor)
+
+        envoltorio.cache_clear = cache.clear
+        envoltorio.cache_put = cache_put
+        return envoltorio
+    return decorador
+
+
+def _consumir_bucket(bucket, lock, capacidad, tasa, coste):
+    """
+    Consume 'coste' unidades de un token bucket [disponible, ultimo_timestamp] que se rellena
+    de forma continua a 'tasa' unidades por segundo hasta 'capacidad'.
+
+    Returns:
+        float: Segundos que el llamador debe esperar antes de hacer la petición (0 si hay saldo).
+    """
+    with lock:
+        ahora = time.time()
+        disponible = min(float(capacidad),
+                         bucket[0] + (ahora - bucket[1]) * tasa)
+        # Se reserva el coste ya (puede quedar en negativo) para que los demás hilos esperen en orden.
+        bucket[0] = disponible - coste
+        bucket[1] = ahora
+    return max(0.0, (coste - disponible) / tasa)
+
 
+def esperar_peso_api(peso=1):
+    """
+    Token bucket compartido por todos los hilos para no superar API_PESO_POR_MINUTO.
+    Bloquea el hilo llamador hasta que haya 'peso' disponible y lo consume.
+    El bucket se rellena de forma continua a API_PESO_POR_MINUTO / 60 unidades por segundo.
+
+    Args:
+        peso (int, optional): Peso de la petición que se va a realizar.
+    """
+    espera = _consumir_bucket(_peso_api, _peso_api_lock, API_PESO_POR_MINUTO,
+                              API_PESO_POR_MINUTO / 60.0, peso)
+    if espera > 0:
+        logging.debug(
+            "⏳ Límite de peso de la API cerca: esperando %.2fs.", espera)
+        time.sleep(espera)
+
+
+async def esperar_peso_api_async(peso=1):
+    """
+    Variante asíncrona de esperar_peso_api para las descargas concurrentes con AsyncClient:
+    consume el mismo token bucket, pero espera con asyncio.sleep sin bloquear el bucle de eventos.
+
+    Args:
+        peso (int, optional): Peso de la petición que se va a realizar.
+    """
+    espera = _consumir_bucket(_peso_api, _peso_api_lock, API_PESO_POR_MINUTO,
+                              API_PESO_POR_MINUTO / 60.0, peso)
+    if espera > 0:
+        logging.debug(
+            "⏳ Límite de peso de la API cerca: esperando %.2fs.", espera)
+        await asyncio.sleep(espera)
+
+
+def esperar_orden():
+    """
+    Token bucket de órdenes compartido por todos los hilos: bloquea al llamador si colocar una
+    orden ahora superaría ORDENES_POR_SEGUNDO, para no recibir el error -1003 (TOO_MANY_REQUESTS).
+    Se llama justo antes de cada client.order_market_*.
+    """
+    espera = _consumir_bucket(_ordenes_api, _ordenes_api_lock, ORDENES_RAFAGA,
+                              ORDENES_POR_SEGUNDO, 1)
+    if espera > 0:
+        logging.debug(
+            "⏳ Límite de órdenes por segundo cerca: esperando %.2fs.", espera)
+        time.sleep(espera)
+
+
+def configurar_pool_conexiones(client, pool_maxsize=HTTP_POOL_MAXSIZE, pool_connections=HTTP_POOL_CONNECTIONS):
+    """
+    Monta en la sesión HTTP del cliente de Binance un adaptador con un pool de conexiones mayor,
+    para que las peticiones concurrentes reutilicen conexiones TLS abiertas en lugar de crear nuevas.
+
+    Args:
+        client: Instancia única del cliente de Binance compartida por todo el bot.
+        pool_maxsize (int, optional): Conexiones máximas reutilizables por host.
+        pool_connections (int, optional): Número de pools de host distintos a mantener.
+    """
+    adaptador = HTTPAdapter(pool_maxsize=pool_maxsize,
+                            pool_connections=pool_connections)
+    client.session.mount('https://', adaptador)
+    logging.info(
+        f"✅ Pool de conexiones HTTP de Binance configurado (pool_maxsize={pool_maxsize}).")
+
+
+@functools.lru_cache(maxsize=256)
+def activo_base(symbol):
+    """
+    Devuelve el activo base de un par contra USDT, memorizado: los símbolos operados son pocos
+    y se consultan en cada ciclo, así que el recorte se hace una sola vez por símbolo.
+    Ej: "BTCUSDT" -> "BTC".
+
+    Args:
+        symbol (str): El par de trading (ej. "BTCUSDT").
+
+    Returns:
+        str: El activo base del par.
+    """
+    return symbol.replace("USDT", "")
+
+
+@ttl_cache(PRECIO_SALDO_CACHE_TTL)
 def obtener_saldo_moneda(client, asset):
     """
     Obtiene el saldo disponible (free) de un activo específico en la cuenta de Binance.
@@ -44,6 +248,7 @@ def obtener_saldo_moneda(client, asset):
         return 0.0
 
 
+@ttl_cache(PRECIO_SALDO_CACHE_TTL)
 def obtener_precio_actual(client, symbol):
     """
     Obtiene el precio de mercado actual de un par de trading.
@@ -71,10 +276,96 @@ def obtener_precio_actual(client, symbol):
         return 0.0
 
 
+def get_symbol_filters(client, symbol, ttl=FILTERS_CACHE_TTL):
+    """
+    Obtiene los filtros de trading de un símbolo, parseados una sola vez y cacheados durante 'ttl' segundos.
+    Evita llamar a client.get_symbol_info (una petición REST) en cada compra o venta.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbol (str): El par de trading (ej. "BTCUSDT").
+        ttl (float, optional): Segundos durante los que se reutilizan los filtros cacheados.
+
+    Returns:
+        SymbolFilters: (step_size, min_qty, min_notional, tick_size). Los filtros no encontrados valen 0.0.
+    """
+    ahora = time.time()
+    cacheado = _filters_cache.get(symbol)
+    if cacheado and cacheado[0] > ahora:
+        return cacheado[1]
+
+    # Obtiene la información de intercambio para el símbolo y recorre sus filtros una sola vez.
+    info = client.get_symbol_info(symbol)
+    if not info:
+        logging.warning(
+            f"⚠️ No se encontró información del símbolo {symbol} en Binance.")
+        return SymbolFilters(0.0, 0.0, 0.0, 0.0)
+
+    filtros = _parsear_filtros(info)
+    _filters_cache[symbol] = (ahora + ttl, filtros)
+    return filtros
+
+
+def _parsear_filtros(info):
+    """
+    Extrae los SymbolFilters (LOT_SIZE, MIN_NOTIONAL/NOTIONAL y PRICE_FILTER) de la información de un
+    símbolo de Binance en una sola pasada.
+    Los filtros no encontrados valen 0.0.
+    """
+    step_size = min_qty = min_notional = tick_size = 0.0
+    for f in info['filters']:
+        if f['filterType'] == 'LOT_SIZE':
+            step_size = float(f['stepSize'])
+            min_qty = float(f['minQty'])
+        elif f['filterType'] in ('MIN_NOTIONAL', 'NOTIONAL'):
+            # Binance ha sustituido MIN_NOTIONAL por NOTIONAL en la mayoría de pares spot;
+            # si llegaran ambos, se aplica el mínimo más restrictivo.
+            min_notional = max(min_notional, float(f['minNotional']))
+        elif f['filterType'] == 'PRICE_FILTER':
+            tick_size = float(f['tickSize'])
+    return SymbolFilters(step_size, min_qty, min_notional, tick_size)
+
+
+def precargar_filtros(client, symbols=None, ttl=FILTERS_CACHE_TTL):
+    """
+    Carga en la caché los filtros de todos los símbolos con una sola llamada a get_exchange_info,
+    en lugar de una petición get_symbol_info por símbolo la primera vez que se opera con cada uno.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbols (list, optional): Símbolos a cachear. Si es None, se cachean todos los del exchange.
+        ttl (float, optional): Segundos durante los que se reutilizan los filtros cacheados.
+
+    Returns:
+        int: Número de símbolos cuyos filtros se cargaron (0 si hubo un error).
+    """
+    try:
+        exchange_info = client.get_exchange_info()
+    except BinanceAPIException as e:
+        logging.error(
+            f"❌ Error de Binance API al precargar filtros de símbolos: {e}", exc_info=True)
+        return 0
+    except Exception as e:
+        logging.error(
+            f"❌ Error al precargar filtros de símbolos: {e}", exc_info=True)
+        return 0
+
+    expiracion = time.time() + ttl
+    seleccion = set(symbols) if symbols is not None else None
+    cargados = 0
+    for info in exchange_info.get('symbols', []):
+        if seleccion is None or info['symbol'] in seleccion:
+            _filters_cache[info['symbol']] = (
+                expiracion, _parsear_filtros(info))
+            cargados += 1
+    logging.info(f"✅ Filtros precargados para {cargados} símbolos.")
+    return cargados
+
+
 def get_step_size(client, symbol):
     """
     Obtiene el 'stepSize' para un símbolo dado, que define la granularidad de la cantidad
-    en las órdenes de Binance.
+    en las órdenes de Binance. Usa los filtros cacheados de get_symbol_filters.
 
     Args:
         client: Instancia del cliente de Binance.
@@ -84,13 +375,9 @@ def get_step_size(client, symbol):
         float: El stepSize para el símbolo. Retorna 0.0 si no se encuentra o hay un error.
     """
     try:
-        # Obtiene la información de intercambio para el símbolo.
-        info = client.get_symbol_info(symbol)
-        if info:
-            # Itera sobre los filtros para encontrar el filtro 'LOT_SIZE'.
-            for f in info['filters']:
-                if f['filterType'] == 'LOT_SIZE':
-                    return float(f['stepSize'])  # Retorna el stepSize.
+        step_size = get_symbol_filters(client, symbol).step_size
+        if step_size > 0:
+            return step_size  # Retorna el stepSize.
         logging.warning(
             f"⚠️ No se encontró el filtro LOT_SIZE para el símbolo {symbol}.")
         return 0.0
@@ -106,6 +393,63 @@ def get_step_size(client, symbol):
         return 0.0
 
 
+# Tolerancia relativa del cociente cantidad/step_size por debajo de la cual ajustar_cantidad
+# no se fía del floor en float64 y recurre a Decimal.
+AJUSTE_EPSILON = 1e-12
+
+
+def _a_decimal(valor):
+    """
+    Convierte un número a Decimal a partir de su representación decimal más corta
+    (p. ej. 0.1 -> Decimal('0.1') y no 0.1000000000000000055...).
+    """
+    return Decimal(repr(float(valor)))
+
+
+def nocional_suficiente(cantidad, precio, min_notional):
+    """
+    Comprueba con aritmética decimal exacta si el valor nocional (cantidad * precio) alcanza el mínimo de Binance.
+    Evita que una orden justo por debajo del mínimo pase la comprobación por redondeo de coma flotante
+    y luego sea rechazada por el exchange.
+
+    Args:
+        cantidad (float): Cantidad de la moneda base.
+        precio (float): Precio unitario en USDT.
+        min_notional (float): Valor mínimo de la orden (filtro MIN_NOTIONAL o NOTIONAL).
+
+    Returns:
+        bool: True si cantidad * precio >= min_notional.
+    """
+    return _a_decimal(cantidad) * _a_decimal(precio) >= _a_decimal(min_notional)
+
+
+def cumple_filtros(cantidad, precio, min_qty, min_notional):
+    """
+    Comprueba que una cantidad sea positiva, no inferior a min_qty y con valor nocional suficiente,
+    usando aritmética decimal exacta.
+
+    Args:
+        cantidad (float): Cantidad de la moneda base (ya ajustada al step_size).
+        precio (float): Precio unitario en USDT.
+        min_qty (float): Cantidad mínima (filtro LOT_SIZE).
+        min_notional (float): Valor mínimo de la orden (filtro MIN_NOTIONAL o NOTIONAL).
+
+    Returns:
+        bool: True si la orden cumple los filtros de Binance.
+    """
+    return (cantidad > 0 and _a_decimal(cantidad) >= _a_decimal(min_qty)
+            and nocional_suficiente(cantidad, precio, min_notional))
+
+
+@functools.lru_cache(maxsize=256)
+def _decimales_step(step_size):
+    """
+    Calcula el número de decimales de un step_size.
+    Ej: 0.001 -> 3, 1.0 -> 0, 0.000001 -> 6.
+    """
+    return int(round(-math.log10(step_size))) if step_size < 1 else 0
+
+
 def ajustar_cantidad(cantidad, step_size):
     """
     Ajusta una cantidad dada al 'stepSize' requerido por Binance.
@@ -124,11 +468,8 @@ def ajustar_cantidad(cantidad, step_size):
             "⚠️ step_size es cero o negativo. No se puede ajustar la cantidad.")
         return 0.0
 
-    # Calcula el número de decimales del step_size.
-    # Ej: step_size = 0.001 -> decimal_places = 3
-    # Ej: step_size = 1.0   -> decimal_places = 0
-    # Ej: step_size = 0.000001 -> decimal_places = 6
-    decimal_places = int(round(-math.log10(step_size))) if step_size < 1 else 0
+    # Número de decimales del step_size (memorizado: los step_size son pocos y fijos por símbolo).
+    decimal_places = _decimales_step(step_size)
 
     # Divide la cantidad por el step_size, redondea al entero más cercano y multiplica por step_size.
     # Esto asegura que la cantidad sea un múltiplo exacto del step_size.
@@ -145,8 +486,14 @@ def ajustar_cantidad(cantidad, step_size):
     # Para asegurar que siempre truncamos hacia abajo (no compramos más de lo que podemos o queremos)
     # y para manejar la precisión de flotantes, es mejor usar la siguiente lógica:
 
-    # Calcula el número de "pasos" que caben en la cantidad.
-    num_steps = math.floor(cantidad / step_size)
+    # Calcula el número de "pasos" (lotes enteros) que caben en la cantidad, en float64 (camino rápido).
+    pasos = cantidad / step_size
+    num_steps = math.floor(pasos)
+    # Con floats, 0.3 / 0.1 = 2.9999999999999996 y el floor perdería un paso entero. Solo cuando el
+    # cociente cae a menos de AJUSTE_EPSILON (relativo) de un entero se recalcula con Decimal exacto.
+    tolerancia = (pasos + 1.0) * AJUSTE_EPSILON
+    if pasos - num_steps < tolerancia or num_steps + 1 - pasos < tolerancia:
+        num_steps = int(_a_decimal(cantidad) // _a_decimal(step_size))
 
     # La cantidad ajustada es el número de pasos multiplicado por el step_size.
     adjusted_cantidad = num_steps * step_size
@@ -155,9 +502,6 @@ def ajustar_cantidad(cantidad, step_size):
     # Esto es crucial para que Binance acepte la orden.
     adjusted_cantidad = round(adjusted_cantidad, decimal_places)
 
-    logging.info(
-        f"DEBUG: Ajustando cantidad {cantidad} con step_size {step_size} (decimales: {decimal_places}). Cantidad ajustada: {adjusted_cantidad}")
-
     return adjusted_cantidad
 
 
@@ -206,7 +550,7 @@ def obtener_saldos_formateados(client, open_positions):
 
     # Obtener saldos de los activos en posiciones abiertas.
     for symbol in open_positions.keys():
-        base_asset = symbol.replace("USDT", "")
+        base_asset = activo_base(symbol)
         saldo_base = obtener_saldo_moneda(client, base_asset)
         # Formatear a 6 decimales para mayor precisión.
         saldos_msg += f" - {base_asset}: {saldo_base:.6f}\n"
@@ -240,3 +584,208 @@ def get_total_capital_usdt(client, open_positions):
                 f"⚠️ No se pudo calcular el valor de la posición para {symbol}: {e}. Se ignorará en el cálculo del capital total.", exc_info=True)
             continue
     return total_capital
+
+
+def consultar_en_paralelo(*llamadas):
+    """
+    Lanza a la vez varias consultas independientes a Binance (saldo, precio, filtros...) y devuelve
+    sus resultados en el mismo orden. Usa el cliente síncrono compartido (y su pool de conexiones)
+    desde el pool de hilos _executor_consultas, de modo que las peticiones quedan en vuelo
+    simultáneamente sin crear un bucle de eventos ni un cliente asíncrono nuevo.
+
+    Args:
+        *llamadas: Tuplas (funcion, arg1, arg2, ...).
+
+    Returns:
+        list: Resultados de cada llamada, en el orden recibido.
+    """
+    futuros = [_executor_consultas.submit(funcion, *args)
+               for funcion, *args in llamadas]
+    return [futuro.result() for futuro in futuros]
+
+
+def tomar_snapshot(client, symbol):
+    """
+    Toma de una sola vez (en paralelo) el precio, el saldo USDT y los filtros de un símbolo, para que
+    el cálculo de la cantidad y la orden de compra trabajen sobre los mismos datos sin volver a consultarlos.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbol (str): El par de trading (ej. "BTCUSDT").
+
+    Returns:
+        MarketSnapshot: (precio, saldo_usdt, filtros).
+    """
+    precio, saldo_usdt, filtros = consultar_en_paralelo(
+        (obtener_precio_actual, client, symbol),
+        (obtener_saldo_moneda, client, "USDT"),
+        (get_symbol_filters, client, symbol))
+    return MarketSnapshot(precio, saldo_usdt, filtros)
+
+
+def limite_velas_desde(start_ms, interval):
+    """
+    Calcula cuántas velas hay desde 'start_ms' hasta ahora (incluida la vela en formación),
+    para pedirlas con una sola llamada a get_klines(startTime=..., limit=...).
+    get_historical_klines hace una petición extra para buscar la primera vela disponible y pagina;
+    con el límite exacto basta una sola petición.
+
+    Args:
+        start_ms (int): Timestamp en milisegundos de la primera vela requerida.
+        interval (str): Intervalo de las velas (ej. KLINE_INTERVAL_1MINUTE).
+
+    Returns:
+        int or None: Límite para get_klines, o None si se superan MAX_VELAS_POR_PETICION
+                     (en ese caso hay que paginar con get_historical_klines).
+    """
+    limite = (int(time.time() * 1000) - start_ms) // interval_to_milliseconds(interval) + 2
+    if limite > MAX_VELAS_POR_PETICION:
+        return None
+    return max(limite, 1)
+
+
+async def _fetch_klines_symbol(async_client, semaforo, symbol, interval, start_ms, limite=None):
+    """
+    Descarga las velas de un símbolo con el cliente asíncrono, limitada por el semáforo.
+    Si start_ms es None se piden las 'limite' velas más recientes.
+    """
+    async with semaforo:
+        try:
+            if start_ms is None:
+                await esperar_peso_api_async(PESO_KLINES)
+                return symbol, await async_client.get_klines(
+                    symbol=symbol, interval=interval, limit=limite)
+            limite = limite_velas_desde(start_ms, interval)
+            if limite is None:
+                # get_historical_klines hace una petición para localizar la primera vela y pagina
+                # de MAX_VELAS_POR_PETICION en MAX_VELAS_POR_PETICION: se reserva el peso de todas.
+                velas = (int(time.time() * 1000) - start_ms) // interval_to_milliseconds(interval) + 1
+                paginas = -(-velas // MAX_VELAS_POR_PETICION)
+                await esperar_peso_api_async(PESO_KLINES * (paginas + 1))
+                return symbol, await async_client.get_historical_klines(symbol, interval, start_ms)
+            await esperar_peso_api_async(PESO_KLINES)
+            return symbol, await async_client.get_klines(
+                symbol=symbol, interval=interval, startTime=start_ms, limit=limite)
+        except BinanceAPIException as e:
+            logging.error(
+                f"❌ Error de Binance API al descargar velas de {symbol}: {e}")
+        except Exception as e:
+            logging.error(f"❌ Error al descargar velas de {symbol}: {e}")
+        return symbol, None
+
+
+def _bucle_async():
+    """
+    Devuelve el bucle de eventos persistente de las descargas concurrentes, creándolo (en un hilo
+    daemon) la primera vez. Un solo bucle permite reutilizar el mismo AsyncClient (y su sesión
+    aiohttp) en todos los barridos en lugar de crear y cerrar uno por barrido.
+    """
+    global _bucle_descargas
+    with _async_lock:
+        if _bucle_descargas is None:
+            _bucle_descargas = asyncio.new_event_loop()
+            threading.Thread(target=_bucle_descargas.run_forever,
+                             daemon=True).start()
+        return _bucle_descargas
+
+
+async def _obtener_async_client(client):
+    """
+    Devuelve el AsyncClient compartido, creándolo la primera vez (AsyncClient.create hace un ping).
+    Solo se llama desde el bucle persistente, así que no hay creaciones concurrentes.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = await AsyncClient.create(testnet=getattr(client, 'testnet', False))
+    return _async_client
+
+
+async def _cerrar_async_client():
+    """
+    Cierra la sesión del AsyncClient compartido.
+    """
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close_connection()
+        _async_client = None
+
+
+def cerrar_async_client():
+    """
+    Cierra el AsyncClient compartido y su sesión HTTP. Se registra con atexit.
+    """
+    if _bucle_descargas is not None and _async_client is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(
+                _cerrar_async_client(), _bucle_descargas).result(timeout=5)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo cerrar el cliente asíncrono de Binance: {e}")
+
+
+async def fetch_all_klines(client, inicios_ms, interval, limite=None):
+    """
+    Descarga en un solo barrido concurrente las velas de varios símbolos usando el AsyncClient
+    compartido y asyncio.gather, en lugar de una petición bloqueante por símbolo.
+    Cada petición consume su peso en el token bucket de la API (esperar_peso_api_async).
+    Debe ejecutarse en el bucle persistente (ver descargar_klines).
+
+    Args:
+        client: Instancia del cliente síncrono de Binance (se usa para saber si se opera en testnet).
+        inicios_ms (dict): {symbol: timestamp en milisegundos desde el que descargar velas, o None
+            para pedir solo las 'limite' velas más recientes}.
+        interval (str): Intervalo de las velas (ej. KLINE_INTERVAL_1MINUTE).
+        limite (int, optional): Número de velas para los símbolos sin timestamp de inicio.
+
+    Returns:
+        dict: {symbol: lista de velas}. Los símbolos cuya descarga falló no se incluyen.
+    """
+    async_client = await _obtener_async_client(client)
+    semaforo = asyncio.Semaphore(MAX_DESCARGAS_CONCURRENTES)
+    resultados = await asyncio.gather(*(
+        _fetch_klines_symbol(async_client, semaforo,
+                             symbol, interval, start_ms, limite)
+        for symbol, start_ms in inicios_ms.items()))
+    return {symbol: klines for symbol, klines in resultados if klines is not None}
+
+
+def descargar_klines(client, inicios_ms, interval, limite=None):
+    """
+    Ejecuta fetch_all_klines en el bucle persistente y espera su resultado (llamada síncrona).
+
+    Args:
+        client: Instancia del cliente de Binance.
+        inicios_ms (dict): {symbol: timestamp de inicio en milisegundos, o None}.
+        interval (str): Intervalo de las velas.
+        limite (int, optional): Número de velas para los símbolos sin timestamp de inicio.
+
+    Returns:
+        dict: {symbol: lista de velas}. Los símbolos cuya descarga falló no se incluyen.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        fetch_all_klines(client, inicios_ms, interval, limite), _bucle_async()).result()
+
+
+def descargar_ultimas_klines(client, symbols, interval, limite):
+    """
+    Descarga a la vez (AsyncClient + asyncio.gather) las 'limite' velas más recientes de varios símbolos.
+    Sustituye a una petición get_klines bloqueante por símbolo dentro del bucle de trading.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbols (list): Lista de pares de trading.
+        interval (str): Intervalo de las velas (ej. KLINE_INTERVAL_1HOUR).
+        limite (int): Número de velas por símbolo.
+
+    Returns:
+        dict: {symbol: lista de velas}. Vacío si la descarga falla; los llamadores recurren entonces a get_klines.
+    """
+    try:
+        return descargar_klines(client, dict.fromkeys(symbols), interval, limite)
+    except Exception as e:
+        logging.error(
+            f"❌ Error en la descarga concurrente de velas de {interval}: {e}", exc_info=True)
+        return {}
+
+
+# Cierra la sesión HTTP del cliente asíncrono compartido al terminar el proceso.
+atexit.register(cerrar_async_client)
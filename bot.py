@@ -18,8 +18,11 @@ import json
 import csv
 import logging
 import threading
+import signal  # Para cerrar de forma ordenada al recibir SIGTERM
+import sys
 from datetime import datetime, timedelta
 import requests
+import numpy as np
 from binance.client import Client
 from binance.enums import *
 
@@ -84,6 +87,8 @@ AI_INTERVAL = 3600 * 12  # Intervalo para optimización AI (1 hora)
 client = Client(API_KEY, API_SECRET, testnet=True,
                 requests_params={'timeout': 30})
 client.API_URL = 'https://testnet.binance.vision/api'
+# Cliente único compartido por todo el bot: amplía su pool de conexiones HTTP reutilizables.
+binance_utils.configurar_pool_conexiones(client)
 
 # ----------------- VARIABLES DE CONTROL -----------------
 posiciones_abiertas = position_manager.load_open_positions(
@@ -547,11 +552,12 @@ def indicadores(symbol):
     """Retorna precio, rsi, ema9, ema21, vol_ratio"""
     klines = client.get_klines(
         symbol=symbol, interval=Client.KLINE_INTERVAL_1HOUR, limit=50)
-    closes = np.array([float(k[4]) for k in klines])
-    vols = np.array([float(k[5]) for k in klines])
-    rsi = talib.RSI(closes, timeperiod=14)[-1]
-    ema_fast = talib.EMA(closes, timeperiod=cfg(symbol)["ema_fast"])[-1]
-    ema_slow = talib.EMA(closes, timeperiod=cfg(symbol)["ema_slow"])[-1]
+    closes = np.array([k[4] for k in klines], dtype=np.float64)
+    vols = np.array([k[5] for k in klines], dtype=np.float64)
+    # Indicadores vectorizados de trading_logic (NumPy/Numba) en lugar de TA-Lib.
+    rsi = trading_logic.calcular_rsi(closes, 14)
+    ema_fast = trading_logic.calcular_ema(closes, cfg(symbol)["ema_fast"])
+    ema_slow = trading_logic.calcular_ema(closes, cfg(symbol)["ema_slow"])
     vol_ratio = vols[-1] / (np.mean(vols[-20:]) + 1e-8)
     price = closes[-1]
     return price, rsi, ema_fast, ema_slow, vol_ratio
@@ -559,6 +565,51 @@ def indicadores(symbol):
     # ---función principal del bot comenzado por el usuario
 
 
+def periodos_indicadores():
+    """
+    Devuelve los periodos de indicadores que se calculan en el ciclo actual: los globales (informe)
+    y los personalizados (cf) de cada símbolo (operaciones de rango y tendencia).
+
+    Returns:
+        tuple: (periodos_globales, {symbol: periodos_cf}), con tuplas
+            (ema_corta, ema_media, ema_larga, rsi).
+    """
+    periodos_globales = (EMA_CORTA_PERIODO, EMA_MEDIA_PERIODO,
+                         EMA_LARGA_PERIODO, RSI_PERIODO)
+    periodos_cf = {}
+    for symbol in SYMBOLS:
+        cf_symbol = bot_params.get("symbols", {}).get(symbol, {})
+        periodos_cf[symbol] = (cf_symbol.get("ema_fast", EMA_CORTA_PERIODO),
+                               cf_symbol.get("ema_slow", EMA_MEDIA_PERIODO),
+                               EMA_LARGA_PERIODO, RSI_PERIODO)
+    return periodos_globales, periodos_cf
+
+
+def calcular_indicadores_simbolos(velas_precargadas, start_ms, periodos_globales, periodos_cf):
+    """
+    Calcula en paralelo (trading_logic.calcular_indicadores_batch) los indicadores de todos los símbolos:
+    los periodos personalizados (cf) usados en las operaciones de rango y tendencia, y los periodos
+    globales usados en el informe.
+
+    Args:
+        velas_precargadas (dict): Velas descargadas por trading_logic.precargar_klines.
+        start_ms (int): Inicio de la ventana de velas del ciclo actual.
+        periodos_globales (tuple): Periodos globales devueltos por periodos_indicadores.
+        periodos_cf (dict): Periodos personalizados por símbolo devueltos por periodos_indicadores.
+
+    Returns:
+        dict: {symbol: {"cf": (ema_c, ema_m, ema_l, rsi), "global": (ema_c, ema_m, ema_l, rsi)}}
+    """
+    resultados_cf = trading_logic.calcular_indicadores_batch(
+        client, SYMBOLS, periodos_cf, velas_precargadas, start_ms)
+    # Solo se recalculan con los periodos globales los símbolos cuyos periodos cf son distintos.
+    distintos = [s for s in SYMBOLS if periodos_cf[s] != periodos_globales]
+    resultados_globales = dict(resultados_cf)
+    resultados_globales.update(trading_logic.calcular_indicadores_batch(
+        client, distintos, periodos_globales, velas_precargadas, start_ms))
+    return {symbol: {"cf": resultados_cf[symbol], "global": resultados_globales[symbol]} for symbol in SYMBOLS}
+
+
 def optimizar_ai_loop(stop_event):
     """Función que ejecuta la optimización cada 24 horas"""
     while not stop_event.is_set():
@@ -584,11 +635,17 @@ def main():  # Define la función principal del bot.
     """
     global last_trading_check_time, ultima_fecha_informe_enviado  # Declara que se usarán/actualizarán estas variables globales.
 
+    # SIGTERM (p. ej. al detener el contenedor) se convierte en una salida normal: sys.exit ejecuta los
+    # manejadores de atexit, que vuelcan las posiciones, parámetros, velas y escrituras pendientes.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # 1. Conecta con Binance
     # Escribe en el log que se iniciará el cliente de Binance.
     logging.info("Iniciando cliente Binance...")
     # Envía un ping a Binance para verificar conectividad y credenciales.
     client.ping()
+    # Carga de una sola vez (get_exchange_info) los filtros de todos los símbolos operados.
+    binance_utils.precargar_filtros(client, SYMBOLS)
 
     # 2. Carga las posiciones que estén abiertas
     # Informa en el log que cargará posiciones abiertas.
@@ -671,22 +728,13 @@ def main():  # Define la función principal del bot.
                         symbols_to_remove.append(symbol)
                         continue  # Continúa con el siguiente símbolo.
                     # Extrae el activo base (p. ej., BTC de BTCUSDT).
-                    base_asset = symbol.replace("USDT", "")
+                    base_asset = binance_utils.activo_base(symbol)
                     actual_balance = binance_utils.obtener_saldo_moneda(  # Obtiene el saldo actual del activo base en la cuenta.
                         # Usa el cliente de Binance para consultar saldos.
                         client, base_asset)
-                    # Pide a Binance la información del símbolo (filtros, pasos, etc.).
-                    info = client.get_symbol_info(symbol)
-                    # Inicializa la cantidad mínima permitida para operar.
-                    min_qty = 0.0
-                    # Recorre los filtros del mercado del símbolo.
-                    for f in info['filters']:
-                        # Busca el filtro de tamaño de lote, que define cantidades mínimas y pasos.
-                        if f['filterType'] == 'LOT_SIZE':
-                            # Toma la cantidad mínima del filtro como flotante.
-                            min_qty = float(f['minQty'])
-                            # Sale del bucle al encontrar el filtro relevante.
-                            break
+                    # Toma la cantidad mínima permitida para operar de los filtros cacheados del símbolo.
+                    min_qty = binance_utils.get_symbol_filters(
+                        client, symbol).min_qty
                     # Define un umbral mínimo para considerar que existe posición/saldo.
                     threshold = max(min_qty, 1e-8)
                     # Si el saldo real es inferior al mínimo operativo...
@@ -741,6 +789,28 @@ def main():  # Define la función principal del bot.
                         # Capital total en EUR.
                         f"💶 Total: {total_capital_eur_global:.2f} EUR\n\n"
                     )
+                # Periodos que se calculan en este ciclo (globales y personalizados de cada símbolo).
+                periodos_globales, periodos_cf = periodos_indicadores()
+                periodos_activos = {symbol: {periodos_globales, periodos_cf[symbol]}
+                                    for symbol in SYMBOLS}
+                # Período más largo de los indicadores y la ventana de velas asociada (+50 velas de margen),
+                # calculada una sola vez por ciclo para que todos los símbolos compartan el mismo inicio.
+                # Incluye los periodos personalizados: pueden ser más largos que los globales.
+                max_lookback = max([max(periodos_globales)] +
+                                   [max(periodos) for periodos in periodos_cf.values()])
+                start_ms = int((time.time() - (max_lookback + 50) * 60) * 1000)
+                # Descarga en un solo barrido concurrente las velas de todos los símbolos para los indicadores;
+                # el estado de los periodos que ya no se usan (p. ej. tras un /set_*) se descarta.
+                velas_precargadas = trading_logic.precargar_klines(
+                    client, SYMBOLS, max_lookback, start_ms, periodos_activos)
+                # Calcula en paralelo los indicadores de todos los símbolos antes de recorrerlos.
+                indicadores_por_simbolo = calcular_indicadores_simbolos(
+                    velas_precargadas, start_ms, periodos_globales, periodos_cf)
+                # Velas de 1H de todos los símbolos (detección de rango y filtro de volumen), descargadas
+                # a la vez en lugar de dos peticiones bloqueantes por símbolo dentro del bucle.
+                velas_1h = binance_utils.descargar_ultimas_klines(
+                    client, SYMBOLS, Client.KLINE_INTERVAL_1HOUR,
+                    max(bot_params.get('RANGO_PERIODO_ANALISIS', 20) + 14, 20))
 # ------------------------------------------------------------------
 #   Recorre todos los símbolos
 # ------------------------------------------------------------------
@@ -749,7 +819,7 @@ def main():  # Define la función principal del bot.
                 # Itera cada par/mercado a monitorear (p. ej., BTCUSDT, ETHUSDT, etc.).
                 for symbol in SYMBOLS:
                     # Obtiene el activo base del símbolo para consultas de saldo.
-                    base = symbol.replace("USDT", "")
+                    base = binance_utils.activo_base(symbol)
                     precio_actual = binance_utils.obtener_precio_actual(  # Consulta el último precio conocido del símbolo.
                         # Usa el cliente de Binance para obtener datos de mercado.
                         client, symbol)
@@ -787,16 +857,15 @@ def main():  # Define la función principal del bot.
                             adx_umbral=bot_params.get('RANGO_ADX_UMBRAL', 25),
                             # Máximo ancho de bandas para rango.
                             band_width_max=bot_params.get(
-                                'RANGO_BAND_WIDTH_MAX', 0.05)
+                                'RANGO_BAND_WIDTH_MAX', 0.05),
+                            # Velas de 1H precargadas en este ciclo (None si su descarga falló).
+                            klines=velas_1h.get(symbol)
                         )  # Fin de la detección de rango.
                         if en_rango:  # Si se considera que hay rango...
                             senal_rango = estrategia_rango(  # Calcula la señal (COMPRA/VENTA/NEUTRO) basada en soporte/resistencia y RSI.
                                 client, symbol, soporte, resistencia,
-                                rsi=trading_logic.calcular_ema_rsi(  # Reutiliza cálculo EMA/RSI para obtener RSI actual.
-                                    client, symbol,
-                                    cf["ema_fast"], cf["ema_slow"],
-                                    # Índice 3 corresponde al RSI retornado.
-                                    EMA_LARGA_PERIODO, RSI_PERIODO)[3],
+                                # Reutiliza el cálculo EMA/RSI del ciclo; el índice 3 corresponde al RSI.
+                                rsi=indicadores_por_simbolo[symbol]["cf"][3],
                                 # Umbral RSI sobreventa para compras en rango.
                                 rsi_sobreventa=bot_params.get(
                                     'RANGO_RSI_SOBREVENTA', 30),
@@ -812,8 +881,11 @@ def main():  # Define la función principal del bot.
 # 11.1 Compra en rango
                             # Condiciones para abrir compra en rango.
                             if senal_rango == 'COMPRA' and symbol not in posiciones_abiertas and saldo_usdt_global > 10:
+                                # Precio, saldo USDT y filtros tomados una sola vez para el cálculo y la orden.
+                                snapshot = binance_utils.tomar_snapshot(
+                                    client, symbol)
                                 cantidad = trading_logic.calcular_cantidad_a_comprar(  # Calcula tamaño de posición según riesgo, SL y capital.
-                                    client, saldo_usdt_global, precio_actual,
+                                    client, snapshot.saldo_usdt, snapshot.precio,
                                     cf["stop_loss_pct"], symbol,
                                     RIESGO_POR_OPERACION_PORCENTAJE, total_capital_usdt_global)
                                 if cantidad > 0:  # Si la cantidad es operable...
@@ -823,7 +895,7 @@ def main():  # Define la función principal del bot.
                                             cf["stop_loss_pct"], transacciones_diarias,
                                             TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID,
                                             # Archivo donde persistir posiciones.
-                                            OPEN_POSITIONS_FILE)
+                                            OPEN_POSITIONS_FILE, snapshot=snapshot)
                                     if orden:  # Si la orden se ejecutó correctamente...
                                         # Añade línea al informe general.
                                         general_message += f"🟢 COMPRA RANGO {symbol}"
@@ -855,8 +927,8 @@ def main():  # Define la función principal del bot.
                                             motivo_venta="VENTA EN RANGO")
                                         bot_params['TOTAL_BENEFICIO_ACUMULADO'] = bot_params.get(  # Asegura clave presente aunque no cambie.
                                             'TOTAL_BENEFICIO_ACUMULADO', 0.0)
-                                        # Persiste la configuración/estadísticas del bot.
-                                        config_manager.save_parameters(
+                                        # Persiste la configuración/estadísticas del bot (guardado diferido).
+                                        config_manager.save_parameters_debounced(
                                             bot_params)
                                     # Si la orden se envió/ejecutó...
                                     if orden:
@@ -869,17 +941,15 @@ def main():  # Define la función principal del bot.
 # ------------------------------------------------------------------
 
  # 12. Operación en tendencia
-                    ema_corta, ema_media, ema_larga, rsi = trading_logic.calcular_ema_rsi(  # Calcula EMAs y RSI para el símbolo actual.
-                        client, symbol,
-                        cf["ema_fast"], cf["ema_slow"],
-                        # Usa periodos configurados.
-                        EMA_LARGA_PERIODO, RSI_PERIODO)
+                    # EMAs y RSI del símbolo actual con sus periodos configurados (calculados en paralelo).
+                    ema_corta, ema_media, ema_larga, rsi = indicadores_por_simbolo[symbol]["cf"]
                     # Si faltan datos para indicadores...
                     if any(v is None for v in (ema_corta, ema_media, ema_larga, rsi)):
                         continue  # Omite este símbolo en este ciclo.
 
  # 13. Filtro de volumen
-                    klines = client.get_klines(  # Solicita las últimas 20 velas de 1 hora para calcular volumen medio.
+                    # Últimas 20 velas de 1 hora para calcular el volumen medio (precargadas o, si faltan, pedidas ahora).
+                    klines = velas_1h.get(symbol) or client.get_klines(
                         symbol=symbol, interval=Client.KLINE_INTERVAL_1HOUR, limit=20)
                     vol_ratio = float(  # Calcula el ratio de volumen: volumen última vela / volumen medio 20 velas.
                         klines[-1][5]) / (sum(float(k[5]) for k in klines[-20:]) / 20 + 1e-8)
@@ -905,8 +975,10 @@ def main():  # Define la función principal del bot.
                         symbol not in posiciones_abiertas
                     )
                     if comprar_cond:  # Si se cumplen todos los criterios de compra...
+                        # Precio, saldo USDT y filtros tomados una sola vez para el cálculo y la orden.
+                        snapshot = binance_utils.tomar_snapshot(client, symbol)
                         cantidad = trading_logic.calcular_cantidad_a_comprar(  # Calcula tamaño de la orden basado en riesgo y SL.
-                            client, saldo_usdt_global, precio_actual,
+                            client, snapshot.saldo_usdt, snapshot.precio,
                             cf["stop_loss_pct"], symbol,
                             RIESGO_POR_OPERACION_PORCENTAJE, total_capital_usdt_global)
                         if cantidad > 0:  # Solo si la cantidad cumple mínimos de exchange.
@@ -915,7 +987,7 @@ def main():  # Define la función principal del bot.
                                     client, symbol, cantidad, posiciones_abiertas,
                                     cf["stop_loss_pct"], transacciones_diarias,
                                     TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID,
-                                    OPEN_POSITIONS_FILE)
+                                    OPEN_POSITIONS_FILE, snapshot=snapshot)
                             if orden:  # Si se envió/ejecutó correctamente...
                                 # Lo refleja en el informe.
                                 general_message += f"✅ COMPRA TENDENCIA {symbol}"
@@ -986,16 +1058,16 @@ def main():  # Define la función principal del bot.
                                     )
                                     bot_params['TOTAL_BENEFICIO_ACUMULADO'] = bot_params.get(  # Asegura que la clave exista (y pueda actualizarse en vender()).
                                         'TOTAL_BENEFICIO_ACUMULADO', 0.0)
-                                    # Guarda la configuración/estadísticas tras la operación.
-                                    config_manager.save_parameters(bot_params)
+                                    # Guarda la configuración/estadísticas tras la operación (guardado diferido).
+                                    config_manager.save_parameters_debounced(
+                                        bot_params)
                                 if orden:  # Si la orden se ejecutó...
                                     # Añade la línea correspondiente al informe general.
                                     general_message += f"🔴 VENTA {motivo} {symbol}"
 
  # 16. Construye línea del informe por símbolo
-                    ema_c, ema_m, ema_l, rsi = trading_logic.calcular_ema_rsi(  # Recalcula EMAs/RSI para mostrar en el informe final por símbolo.
-                        client, symbol, EMA_CORTA_PERIODO, EMA_MEDIA_PERIODO,
-                        EMA_LARGA_PERIODO, RSI_PERIODO)
+                    # EMAs/RSI con los periodos globales para mostrar en el informe final por símbolo.
+                    ema_c, ema_m, ema_l, rsi = indicadores_por_simbolo[symbol]["global"]
                     # Si no hay datos suficientes para indicadores...
                     if any(v is None for v in (ema_c, ema_m, ema_l, rsi)):
                         # Omite la agregación del mensaje para este símbolo.
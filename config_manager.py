@@ -4,6 +4,12 @@ import json
 import logging
 # Importa el módulo os para interactuar con el sistema operativo, como acceder a variables de entorno.
 import os
+# Importa time para el debounce del guardado de parámetros.
+import time
+# Importa threading para el temporizador del guardado diferido y su lock.
+import threading
+# Importa atexit para volcar el guardado pendiente al cerrar el proceso.
+import atexit
 # Importa el nuevo módulo para Firestore, que permite la interacción con la base de datos Firestore.
 import firestore_utils
 
@@ -23,6 +29,19 @@ FIRESTORE_CONFIG_DOC_ID = "bot_parameters"
 # utilizando '__app_id' que es una variable de entorno proporcionada por el entorno de Canvas/Railway.
 FIRESTORE_CONFIG_COLLECTION_PATH = f"artifacts/{os.getenv('__app_id', 'default-app-id')}/public/data/bot_configs"
 
+# Intervalo mínimo (segundos) entre dos guardados de parámetros hechos con save_parameters_debounced.
+SAVE_DEBOUNCE_INTERVAL = 2
+# Momento del último guardado diferido.
+_ultimo_guardado = 0
+# Última copia de parámetros pendiente de guardar (None si no hay nada pendiente).
+_parametros_pendientes = None
+# Temporizador que guardará la copia pendiente al terminar la ventana de debounce.
+_temporizador_guardado = None
+# Lock reentrante que protege el estado del debounce (hilo principal, temporizador y cierre del proceso).
+_guardado_lock = threading.RLock()
+# Lock reentrante que serializa los volcados para que una copia antigua nunca pise a una más nueva.
+_escritura_lock = threading.RLock()
+
 
 def load_parameters():
     """
@@ -117,6 +136,26 @@ def load_parameters():
 
 
 def save_parameters(params):
+    """
+    Guarda los parámetros del bot de forma inmediata (p. ej. tras un comando /set_* de Telegram).
+    Descarta cualquier copia pendiente de save_parameters_debounced: es más antigua que 'params'
+    y, si se guardara después, revertiría el cambio en Firestore y en disco.
+
+    Returns:
+        bool: True si el guardado fue exitoso, False en caso contrario.
+    """
+    global _parametros_pendientes, _temporizador_guardado
+    # El lock de escritura espera a un volcado diferido en curso y evita que otro empiece después.
+    with _escritura_lock:
+        with _guardado_lock:
+            if _temporizador_guardado is not None:
+                _temporizador_guardado.cancel()
+                _temporizador_guardado = None
+            _parametros_pendientes = None
+        return _escribir_parametros(params)
+
+
+def _escribir_parametros(params):
     """
     Guarda los parámetros del bot.
     La función intenta guardar los parámetros en Firestore primero para asegurar la persistencia.
@@ -128,8 +167,8 @@ def save_parameters(params):
     if db:  # Si la conexión a Firestore es exitosa.
         try:
             # Registra el beneficio que se va a guardar en Firestore para depuración.
-            logging.info(
-                f"DEBUG: Guardando parámetros en Firestore. Beneficio a guardar: {params.get('TOTAL_BENEFICIO_ACUMULADO', 0.0):.2f} USDT")
+            logging.debug("Guardando parámetros en Firestore. Beneficio a guardar: %.2f USDT",
+                          params.get('TOTAL_BENEFICIO_ACUMULADO', 0.0))
             # Obtiene una referencia al documento de configuración en Firestore.
             doc_ref = db.collection(FIRESTORE_CONFIG_COLLECTION_PATH).document(
                 FIRESTORE_CONFIG_DOC_ID)
@@ -146,10 +185,13 @@ def save_parameters(params):
                 "⚠️ Fallback: Intentando guardar en archivo local.")
 
     # Fallback a archivo local: Si Firestore no estaba disponible o falló.
+    # Se escribe en un archivo temporal y se renombra (os.replace) para no dejar nunca un config.json a medias.
+    ruta_temporal = f"{CONFIG_FILE}.tmp"
     try:
-        with open(CONFIG_FILE, 'w') as f:  # Abre el archivo en modo escritura.
+        with open(ruta_temporal, 'w') as f:  # Abre el archivo temporal en modo escritura.
             # Guarda los parámetros en formato JSON con indentación para legibilidad.
             json.dump(params, f, indent=4)
+        os.replace(ruta_temporal, CONFIG_FILE)
         logging.info(f"✅ Parámetros guardados en {CONFIG_FILE}.")
         return True  # Indica que el guardado fue exitoso.
     except IOError as e:
@@ -161,3 +203,57 @@ def save_parameters(params):
         logging.error(
             f"❌ Error inesperado al guardar parámetros en {CONFIG_FILE}: {e}")
         return False  # Indica que el guardado falló.
+
+
+def save_parameters_debounced(params):
+    """
+    Guarda los parámetros del bot con un "debounce": como máximo un guardado cada
+    SAVE_DEBOUNCE_INTERVAL segundos. Pensado para el camino de las operaciones (p. ej. actualizar
+    TOTAL_BENEFICIO_ACUMULADO tras cada venta), donde varias ventas seguidas se agrupan en una
+    sola escritura. Las llamadas dentro de la ventana no se pierden: un temporizador guarda la
+    última copia al cerrarse la ventana. La llamada no bloquea: la escritura en Firestore/disco
+    se hace en el hilo del temporizador.
+    """
+    global _parametros_pendientes, _temporizador_guardado
+    # Copia superficial: el llamador sigue modificando bot_params en memoria.
+    instantanea = dict(params)
+    with _guardado_lock:
+        _parametros_pendientes = instantanea
+        if _temporizador_guardado is None:
+            # El guardado (Firestore o disco) siempre se hace en el hilo del temporizador, nunca en el
+            # camino de la operación: inmediato si ya pasó la ventana, o al final de la ventana si no.
+            restante = max(0.0, SAVE_DEBOUNCE_INTERVAL - (time.time() - _ultimo_guardado))
+            _temporizador_guardado = threading.Timer(restante, flush)
+            _temporizador_guardado.daemon = True
+            _temporizador_guardado.start()
+            if restante > 0:
+                logging.debug(
+                    "⏳ Guardado de parámetros pospuesto (debounce). Próximo guardado en %.2fs", restante)
+
+
+def flush():
+    """
+    Guarda inmediatamente la última copia pendiente de parámetros, si la hay.
+    Se llama desde el temporizador del debounce y al cerrar el proceso.
+
+    Returns:
+        bool: True si no había nada pendiente o se guardó con éxito, False en caso contrario.
+    """
+    global _ultimo_guardado, _parametros_pendientes, _temporizador_guardado
+    # El lock de escritura serializa los volcados (en orden) sin bloquear a quien solo encola.
+    with _escritura_lock:
+        with _guardado_lock:
+            if _temporizador_guardado is not None:
+                _temporizador_guardado.cancel()
+                _temporizador_guardado = None
+            params = _parametros_pendientes
+            _parametros_pendientes = None
+            if params is None:
+                return True
+            _ultimo_guardado = time.time()
+        # El guardado se hace fuera del lock del estado: nuevas llamadas pueden encolar mientras tanto.
+        return _escribir_parametros(params)
+
+
+# Vuelca los parámetros pendientes al terminar el proceso (también tras SIGTERM, que sale con sys.exit).
+atexit.register(flush)
@@ -4,8 +4,20 @@ import logging
 import os
 # Importa el módulo json para trabajar con datos en formato JSON, necesario para parsear las credenciales de Firebase.
 import json
+# Importa atexit para vaciar la cola de escrituras pendientes al cerrar el proceso.
+import atexit
+# Importa queue para encolar las escrituras en Firestore fuera del camino crítico de las órdenes.
+import queue
+# Importa threading para el hilo escritor en segundo plano.
+import threading
+# Importa time para la ventana de agrupación de escrituras.
+import time
+# Importa orjson para guardar en disco (JSON por líneas) los documentos que no se pudieron escribir.
+import orjson
 # Importa las clases necesarias del SDK de Firebase Admin para Python.
 from firebase_admin import credentials, initialize_app, firestore
+# Importa los errores transitorios de la API de Google para reintentar los lotes que fallan.
+from google.api_core.exceptions import Aborted, DeadlineExceeded, ServiceUnavailable
 
 # ---------- CONSTANTES ----------
 FIRESTORE_TRANSACTIONS_COLLECTION_PATH = f"artifacts/{os.getenv('__app_id', 'default-app-id')}/public/data/transactions_history"
@@ -20,6 +32,31 @@ logging.basicConfig(level=logging.INFO,
 # Se inicializa como None y se asignará la instancia de Firestore una vez que se inicialice.
 db = None
 
+# Número máximo de documentos por lote de escritura (por debajo del límite de 500 de un WriteBatch).
+FIRESTORE_BATCH_MAX = 450
+# Segundos que el hilo escritor espera a que lleguen más documentos antes de confirmar el lote,
+# para agrupar en una sola petición las ráfagas de compras/ventas de un mismo ciclo.
+FIRESTORE_FLUSH_INTERVAL = 2.0
+# Intentos máximos para confirmar un lote ante errores transitorios (contención, timeout, servicio caído).
+FIRESTORE_REINTENTOS = 3
+# Espera base (en segundos) entre reintentos; se duplica en cada intento.
+FIRESTORE_ESPERA_REINTENTO = 0.5
+# Cola de documentos pendientes de guardar: elementos (ruta_coleccion, documento).
+_cola_escrituras = queue.Queue()
+# Lock para que dos hilos no inicialicen Firebase a la vez (initialize_app falla si se llama dos veces).
+_init_lock = threading.Lock()
+# Hilo escritor en segundo plano (se inicia bajo demanda con la primera escritura encolada).
+_hilo_escritor = None
+# Lock para evitar que se inicien dos hilos escritores a la vez.
+_hilo_escritor_lock = threading.Lock()
+# Archivo local (JSON por líneas) donde se guardan los documentos de los lotes que no se pudieron
+# escribir en Firestore; se vuelven a encolar cuando arranca el hilo escritor.
+FIRESTORE_PENDIENTES_FILE = "firestore_pendientes.jsonl"
+# Lock que serializa el acceso al archivo de documentos pendientes.
+_pendientes_lock = threading.Lock()
+# Referencias a colecciones ya creadas, por ruta (son objetos ligeros y sin estado, seguros de reutilizar).
+_colecciones = {}
+
 
 def initialize_firestore():
     """
@@ -78,6 +115,8 @@ def get_firestore_db():
     """
     Devuelve la instancia de la base de datos Firestore.
     Esta función es un wrapper conveniente para acceder a la instancia de Firestore.
+    El cliente es único para todo el proceso: mantiene su propio pool de conexiones gRPC
+    y admite llamadas concurrentes, así que se comparte entre todas las colecciones.
     Si la base de datos no ha sido inicializada previamente, llama a `initialize_firestore()`
     para configurarla.
 
@@ -88,6 +127,205 @@ def get_firestore_db():
     if db is None:
         # Si la instancia de Firestore aún no está asignada (es None),
         # se llama a `initialize_firestore()` para intentar inicializarla.
-        db = initialize_firestore()
+        # El lock garantiza un único cliente (y un único canal gRPC) aunque varios hilos lo pidan a la vez.
+        with _init_lock:
+            if db is None:
+                db = initialize_firestore()
     # Devuelve la instancia (ya sea la recién inicializada o una existente).
     return db
+
+
+def _obtener_lote(bloquear):
+    """
+    Extrae de la cola hasta FIRESTORE_BATCH_MAX documentos pendientes.
+    Si 'bloquear' es True, espera hasta que haya al menos uno y, desde ese momento, sigue acumulando
+    documentos durante FIRESTORE_FLUSH_INTERVAL segundos o hasta llenar el lote.
+    Si es False, solo toma los que ya estén en la cola.
+    """
+    lote = []
+    try:
+        lote.append(_cola_escrituras.get(block=bloquear))
+        limite = time.time() + FIRESTORE_FLUSH_INTERVAL
+        while len(lote) < FIRESTORE_BATCH_MAX:
+            restante = limite - time.time()
+            if not bloquear or restante <= 0:
+                lote.append(_cola_escrituras.get_nowait())
+            else:
+                lote.append(_cola_escrituras.get(timeout=restante))
+    except queue.Empty:
+        pass
+    return lote
+
+
+def _obtener_coleccion(database, ruta_coleccion):
+    """
+    Devuelve la referencia a una colección de Firestore, creándola solo la primera vez por ruta.
+    """
+    coleccion = _colecciones.get(ruta_coleccion)
+    if coleccion is None:
+        coleccion = _colecciones[ruta_coleccion] = database.collection(
+            ruta_coleccion)
+    return coleccion
+
+
+def _alertar(mensaje):
+    """
+    Avisa por Telegram de un problema con las escrituras en Firestore (además del log).
+    telegram_handler se importa aquí para evitar la importación circular
+    (telegram_handler -> config_manager -> firestore_utils).
+    """
+    token = os.getenv("TELEGRAM_TOKEN")
+    chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    if not token or not chat_id:
+        return
+    try:
+        import telegram_handler
+        telegram_handler.send_telegram_message(token, chat_id, mensaje)
+    except Exception as e:
+        logging.error(f"❌ No se pudo enviar la alerta de Firestore por Telegram: {e}")
+
+
+def _guardar_pendientes(lote, motivo):
+    """
+    Guarda en FIRESTORE_PENDIENTES_FILE los documentos de un lote que no se pudo escribir en Firestore,
+    para no perderlos, y lanza una alerta. Se vuelven a encolar con reencolar_pendientes.
+
+    Args:
+        lote (list): Elementos (ruta_coleccion, documento).
+        motivo (str): Descripción del error, para el log y la alerta.
+    """
+    try:
+        with _pendientes_lock:
+            with open(FIRESTORE_PENDIENTES_FILE, 'ab') as f:
+                for ruta_coleccion, documento in lote:
+                    f.write(orjson.dumps([ruta_coleccion, documento], default=str) + b"\n")
+        mensaje = (f"⚠️ No se pudieron guardar {len(lote)} documento(s) en Firestore ({motivo}). "
+                   f"Se han guardado en {FIRESTORE_PENDIENTES_FILE} y se reintentarán.")
+        logging.critical(mensaje)
+    except Exception as e:
+        mensaje = (f"❌ No se pudieron guardar {len(lote)} documento(s) en Firestore ({motivo}) "
+                   f"ni en {FIRESTORE_PENDIENTES_FILE} ({e}). Documentos: {lote}")
+        logging.critical(mensaje)
+    _alertar(mensaje)
+
+
+def reencolar_pendientes():
+    """
+    Vuelve a encolar los documentos guardados en FIRESTORE_PENDIENTES_FILE tras un fallo anterior.
+    Si vuelven a fallar, _escribir_lote los guarda de nuevo en el archivo.
+
+    Returns:
+        int: Número de documentos reencolados.
+    """
+    with _pendientes_lock:
+        if not os.path.exists(FIRESTORE_PENDIENTES_FILE):
+            return 0
+        try:
+            with open(FIRESTORE_PENDIENTES_FILE, 'rb') as f:
+                pendientes = [orjson.loads(linea) for linea in f if linea.strip()]
+            os.remove(FIRESTORE_PENDIENTES_FILE)
+        except Exception as e:
+            logging.error(
+                f"❌ Error al leer los documentos pendientes de {FIRESTORE_PENDIENTES_FILE}: {e}")
+            return 0
+    for ruta_coleccion, documento in pendientes:
+        _cola_escrituras.put((ruta_coleccion, documento))
+    if pendientes:
+        logging.info(
+            f"✅ {len(pendientes)} documento(s) pendientes reencolados para Firestore.")
+    return len(pendientes)
+
+
+def _escribir_lote(lote):
+    """
+    Guarda un lote de documentos en Firestore con un único WriteBatch (una sola petición).
+    Si el lote no se puede escribir, sus documentos se guardan en disco (_guardar_pendientes):
+    un lote nunca se descarta.
+    """
+    database = get_firestore_db()
+    if database is None:
+        _guardar_pendientes(lote, "Firestore no disponible")
+        return
+    # Las referencias de los documentos se crean una sola vez: si se reintenta el lote, se reescriben
+    # los mismos documentos (batch.set es idempotente) en lugar de duplicar transacciones.
+    referencias = [(_obtener_coleccion(database, ruta_coleccion).document(), documento)
+                   for ruta_coleccion, documento in lote]
+    for intento in range(1, FIRESTORE_REINTENTOS + 1):
+        try:
+            batch = database.batch()
+            for referencia, documento in referencias:
+                batch.set(referencia, documento)
+            batch.commit()
+            logging.info(f"✅ {len(lote)} documento(s) guardado(s) en Firestore.")
+            # Firestore vuelve a responder: se reintentan los documentos de fallos anteriores.
+            if os.path.exists(FIRESTORE_PENDIENTES_FILE):
+                reencolar_pendientes()
+            return
+        except (Aborted, DeadlineExceeded, ServiceUnavailable) as e:
+            if intento == FIRESTORE_REINTENTOS:
+                _guardar_pendientes(lote, f"error transitorio persistente: {e}")
+                return
+            espera = FIRESTORE_ESPERA_REINTENTO * 2 ** (intento - 1)
+            logging.warning(
+                f"⚠️ Error transitorio de Firestore ({e}). Reintentando en {espera:.1f}s ({intento}/{FIRESTORE_REINTENTOS}).")
+            time.sleep(espera)
+        except Exception as e:
+            logging.error(
+                f"❌ Error al guardar {len(lote)} documento(s) en Firestore: {e}", exc_info=True)
+            _guardar_pendientes(lote, str(e))
+            return
+
+
+def _escritor_firestore():
+    """
+    Bucle del hilo escritor: espera documentos en la cola y los guarda por lotes.
+    Al arrancar, reencola los documentos que quedaron pendientes de un fallo anterior.
+    """
+    reencolar_pendientes()
+    while True:
+        lote = _obtener_lote(bloquear=True)
+        try:
+            _escribir_lote(lote)
+        finally:
+            for _ in lote:
+                _cola_escrituras.task_done()
+
+
+def encolar_documento(ruta_coleccion, documento):
+    """
+    Encola un documento para guardarlo en Firestore desde un hilo en segundo plano.
+    Es la alternativa no bloqueante a db.collection(ruta).add(documento): la llamada tarda
+    microsegundos y la escritura (una petición de red de ~100-300 ms) no retrasa la siguiente operación.
+
+    Args:
+        ruta_coleccion (str): Ruta de la colección de Firestore.
+        documento (dict): Datos del documento a añadir.
+    """
+    global _hilo_escritor
+    with _hilo_escritor_lock:
+        if _hilo_escritor is None or not _hilo_escritor.is_alive():
+            _hilo_escritor = threading.Thread(
+                target=_escritor_firestore, daemon=True)
+            _hilo_escritor.start()
+    _cola_escrituras.put((ruta_coleccion, documento))
+
+
+def vaciar_cola_escrituras():
+    """
+    Guarda de forma síncrona todos los documentos que sigan en la cola y espera al lote en curso.
+    Se registra con atexit para no perder transacciones al cerrar el bot.
+    """
+    while True:
+        lote = _obtener_lote(bloquear=False)
+        if not lote:
+            break
+        try:
+            _escribir_lote(lote)
+        finally:
+            for _ in lote:
+                _cola_escrituras.task_done()
+    if _hilo_escritor is not None and _hilo_escritor.is_alive():
+        _cola_escrituras.join()
+
+
+atexit.register(vaciar_cola_escrituras)
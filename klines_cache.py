@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+klines_cache.py
+Caché local en disco de velas (klines) de Binance.
+Guarda solo velas CERRADAS por (símbolo, intervalo) para que, tras un reinicio,
+el bot solo tenga que descargar las velas posteriores a la última almacenada.
+Las velas se mantienen en memoria; el disco solo se escribe en segundo plano (como mucho una
+vez cada CACHE_GUARDADO_INTERVALO segundos por archivo) y al cerrar el proceso.
+"""
+
+# Importa orjson para leer y escribir la caché en formato JSON (mucho más rápido que json con miles de velas).
+import orjson
+# Importa el módulo logging para registrar eventos y mensajes.
+import logging
+# Importa el módulo os para crear el directorio de caché y comprobar archivos.
+import os
+# Importa threading para los locks por archivo y el temporizador del guardado diferido.
+import threading
+# Importa atexit para volcar a disco las velas pendientes al cerrar el proceso.
+import atexit
+
+# Configura el sistema de registro básico para este módulo.
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Directorio donde se guardan los archivos de caché (uno por símbolo e intervalo).
+CACHE_DIR = "cache"
+# Número máximo de velas que se conservan por archivo para acotar su tamaño.
+MAX_VELAS_CACHE = 1000
+# Segundos que se acumulan velas nuevas en memoria antes de volcarlas a disco.
+CACHE_GUARDADO_INTERVALO = 60
+
+# Velas en memoria por archivo: {ruta: {hora_apertura: vela}}. Se cargan del disco la primera vez.
+_velas = {}
+# Un lock por archivo, para que los hilos de distintos símbolos no se bloqueen entre sí.
+_locks = {}
+# Lock que protege la creación de los locks por archivo.
+_locks_lock = threading.Lock()
+# Rutas con velas nuevas aún no volcadas a disco.
+_pendientes = set()
+# Temporizador del próximo volcado (None si no hay ninguno programado).
+_temporizador = None
+# Lock que protege _pendientes y _temporizador.
+_pendientes_lock = threading.Lock()
+# Lock que serializa los volcados (temporizador y cierre del proceso).
+_escritura_lock = threading.Lock()
+
+
+def _ruta_cache(symbol, interval):
+    """
+    Devuelve la ruta del archivo de caché para un símbolo e intervalo.
+    """
+    return os.path.join(CACHE_DIR, f"{symbol}_{interval}.json")
+
+
+def _lock_de(ruta):
+    """
+    Devuelve el lock de un archivo de caché, creándolo la primera vez.
+    """
+    with _locks_lock:
+        lock = _locks.get(ruta)
+        if lock is None:
+            lock = _locks[ruta] = threading.Lock()
+        return lock
+
+
+def _leer(ruta):
+    """
+    Lee las velas de un archivo de caché. Retorna una lista vacía si no existe o está corrupto.
+    """
+    if not os.path.exists(ruta):
+        return []
+    try:
+        with open(ruta, 'rb') as f:
+            return orjson.loads(f.read())
+    except orjson.JSONDecodeError as e:
+        logging.warning(
+            f"⚠️ Caché de velas corrupta en {ruta}: {e}. Se ignorará.")
+        return []
+    except Exception as e:
+        logging.error(f"❌ Error al leer la caché de velas {ruta}: {e}")
+        return []
+
+
+def _velas_de(ruta):
+    """
+    Devuelve el diccionario en memoria de un archivo, cargándolo del disco la primera vez.
+    Debe llamarse con el lock del archivo adquirido.
+    """
+    velas = _velas.get(ruta)
+    if velas is None:
+        velas = _velas[ruta] = {k[0]: k for k in _leer(ruta)}
+    return velas
+
+
+def load(symbol, interval):
+    """
+    Carga las velas cerradas almacenadas para un símbolo e intervalo.
+
+    Args:
+        symbol (str): El par de trading (ej. "BTCUSDT").
+        interval (str): Intervalo de las velas (ej. KLINE_INTERVAL_1MINUTE).
+
+    Returns:
+        list: Lista de velas en el formato de la API de Binance, ordenadas por hora de apertura.
+    """
+    ruta = _ruta_cache(symbol, interval)
+    with _lock_de(ruta):
+        velas = _velas_de(ruta)
+        return [velas[t] for t in sorted(velas)]
+
+
+def append(symbol, interval, rows):
+    """
+    Añade velas cerradas a la caché en memoria, eliminando duplicados por hora de apertura (k[0])
+    y conservando solo las MAX_VELAS_CACHE más recientes. No escribe en disco: programa un volcado
+    en segundo plano (ver flush).
+
+    Args:
+        symbol (str): El par de trading (ej. "BTCUSDT").
+        interval (str): Intervalo de las velas (ej. KLINE_INTERVAL_1MINUTE).
+        rows (list): Velas cerradas en el formato de la API de Binance.
+
+    Returns:
+        bool: True (el guardado en disco se hace después; sus errores se registran en flush).
+    """
+    global _temporizador
+    if not rows:
+        return True
+    ruta = _ruta_cache(symbol, interval)
+    with _lock_de(ruta):
+        # Fusiona las velas nuevas con las existentes; las nuevas prevalecen.
+        velas = _velas_de(ruta)
+        for k in rows:
+            velas[k[0]] = k
+        if len(velas) > MAX_VELAS_CACHE:
+            for t in sorted(velas)[:-MAX_VELAS_CACHE]:
+                del velas[t]
+    with _pendientes_lock:
+        _pendientes.add(ruta)
+        if _temporizador is None:
+            _temporizador = threading.Timer(CACHE_GUARDADO_INTERVALO, flush)
+            _temporizador.daemon = True
+            _temporizador.start()
+    return True
+
+
+def _escribir(ruta, velas_ordenadas):
+    """
+    Escribe un archivo de caché de forma atómica (archivo temporal + os.replace).
+
+    Returns:
+        bool: True si la caché se guardó con éxito, False en caso contrario.
+    """
+    ruta_temporal = f"{ruta}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(ruta_temporal, 'wb') as f:
+            f.write(orjson.dumps(velas_ordenadas))
+        os.replace(ruta_temporal, ruta)
+        return True
+    except IOError as e:
+        logging.error(
+            f"❌ Error al escribir la caché de velas {ruta}: {e}")
+        return False
+    except Exception as e:
+        logging.error(
+            f"❌ Error inesperado al guardar la caché de velas {ruta}: {e}")
+        return False
+
+
+def flush():
+    """
+    Vuelca a disco los archivos de caché con velas nuevas. Se llama desde el temporizador del
+    guardado diferido y al cerrar el proceso.
+
+    Returns:
+        bool: True si no había nada pendiente o todo se guardó con éxito, False en caso contrario.
+    """
+    global _temporizador
+    with _escritura_lock:
+        with _pendientes_lock:
+            if _temporizador is not None:
+                _temporizador.cancel()
+                _temporizador = None
+            rutas = list(_pendientes)
+            _pendientes.clear()
+        exito = True
+        for ruta in rutas:
+            # Copia ordenada bajo el lock del archivo; la escritura se hace fuera para no bloquear
+            # a los hilos que siguen añadiendo velas.
+            with _lock_de(ruta):
+                velas = _velas.get(ruta, {})
+                velas_ordenadas = [velas[t] for t in sorted(velas)]
+            exito = _escribir(ruta, velas_ordenadas) and exito
+        return exito
+
+
+# Vuelca las velas pendientes al terminar el proceso.
+atexit.register(flush)
@@ -2,6 +2,9 @@ import json
 import logging
 import os
 import time
+import atexit # Para volcar el guardado pendiente al cerrar el proceso
+import threading # Temporizador del guardado diferido
+import orjson # Serialización rápida (soporta tipos numpy) del archivo local
 import firestore_utils # Importa el nuevo módulo para Firestore
 
 # Configura el sistema de registro para este módulo.
@@ -18,6 +21,14 @@ FIRESTORE_POSITIONS_COLLECTION_PATH = f"artifacts/{os.getenv('__app_id', 'defaul
 # Variable para implementar el debounce en el guardado de posiciones
 last_save_time = 0
 SAVE_DEBOUNCE_INTERVAL = 5 # Guarda como máximo cada 5 segundos
+# Última instantánea de posiciones pendiente de guardar (None si no hay nada pendiente)
+_posiciones_pendientes = None
+# Temporizador que guardará la instantánea pendiente al terminar la ventana de debounce
+_temporizador_guardado = None
+# Lock reentrante que protege el estado del debounce (hilo principal, temporizador y cierre del proceso)
+_guardado_lock = threading.RLock()
+# Lock reentrante que serializa los volcados para que una copia antigua nunca pise a una más nueva.
+_escritura_lock = threading.RLock()
 
 def load_open_positions(stop_loss_porcentaje):
     """
@@ -85,29 +96,73 @@ def save_open_positions(positions):
             logging.error(f"❌ Error al guardar posiciones en Firestore: {e}", exc_info=True)
             logging.warning("⚠️ Fallback: Intentando guardar en archivo local.")
 
-    # Fallback a archivo local
+    # Fallback a archivo local (escritura atómica: archivo temporal + os.replace)
+    ruta_temporal = f"{OPEN_POSITIONS_FILE}.tmp"
     try:
-        with open(OPEN_POSITIONS_FILE, 'w') as f:
-            json.dump(positions, f, indent=4)
+        with open(ruta_temporal, 'wb') as f:
+            f.write(orjson.dumps(positions, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta_temporal, OPEN_POSITIONS_FILE)
         logging.info(f"✅ Posiciones abiertas guardadas en {OPEN_POSITIONS_FILE}.")
         return True
     except IOError as e:
         logging.error(f"❌ Error al escribir en el archivo {OPEN_POSITIONS_FILE}: {e}")
         return False
+    except (TypeError, orjson.JSONEncodeError) as e:
+        logging.error(f"❌ Error al serializar las posiciones para {OPEN_POSITIONS_FILE}: {e}")
+        return False
     except Exception as e:
         logging.error(f"❌ Error inesperado al guardar posiciones en {OPEN_POSITIONS_FILE}: {e}")
         return False
 
 def save_open_positions_debounced(positions):
     """
-    Guarda las posiciones abiertas, pero con un "debounce" para evitar escrituras excesivas.
-    Solo guarda si ha pasado un cierto tiempo desde la última escritura.
+    Guarda las posiciones abiertas con un "debounce": como máximo un guardado cada
+    SAVE_DEBOUNCE_INTERVAL segundos. Las llamadas dentro de la ventana no se descartan:
+    se conserva la última instantánea y un temporizador la guarda al cerrarse la ventana,
+    de modo que varias operaciones seguidas se agrupan en una sola escritura.
+    La llamada no bloquea: la escritura en Firestore/disco se hace en el hilo del temporizador.
+    """
+    global _posiciones_pendientes, _temporizador_guardado
+    # Copia superficial por símbolo: el llamador sigue modificando el diccionario en memoria.
+    instantanea = {symbol: dict(data) for symbol, data in positions.items()}
+    with _guardado_lock:
+        _posiciones_pendientes = instantanea
+        if _temporizador_guardado is None:
+            # El guardado (Firestore o disco) siempre se hace en el hilo del temporizador, nunca en el
+            # camino de la operación: inmediato si ya pasó la ventana, o al final de la ventana si no.
+            restante = max(0.0, SAVE_DEBOUNCE_INTERVAL - (time.time() - last_save_time))
+            _temporizador_guardado = threading.Timer(restante, flush)
+            _temporizador_guardado.daemon = True
+            _temporizador_guardado.start()
+            if restante > 0:
+                logging.debug(
+                    "⏳ Guardado de posiciones pospuesto (debounce). Próximo guardado en %.2fs", restante)
+
+def flush():
+    """
+    Guarda inmediatamente la última instantánea pendiente de posiciones, si la hay.
+    Se llama desde el temporizador del debounce, al cerrar el proceso y al recibir SIGTERM.
+
+    Returns:
+        bool: True si no había nada pendiente o se guardó con éxito, False en caso contrario.
     """
-    global last_save_time
-    current_time = time.time()
-    if (current_time - last_save_time) >= SAVE_DEBOUNCE_INTERVAL:
-        save_open_positions(positions)
-        last_save_time = current_time
-    else:
-        logging.debug(f"⏳ Guardado de posiciones pospuesto (debounce). Próximo guardado en {SAVE_DEBOUNCE_INTERVAL - (current_time - last_save_time):.2f}s")
+    global last_save_time, _posiciones_pendientes, _temporizador_guardado
+    # El lock de escritura serializa los volcados (en orden) sin bloquear a quien solo encola.
+    with _escritura_lock:
+        with _guardado_lock:
+            if _temporizador_guardado is not None:
+                _temporizador_guardado.cancel()
+                _temporizador_guardado = None
+            posiciones = _posiciones_pendientes
+            _posiciones_pendientes = None
+            if posiciones is None:
+                return True
+            last_save_time = time.time()
+        # El guardado se hace fuera del lock del estado: nuevas llamadas pueden encolar mientras tanto.
+        return save_open_positions(posiciones)
 
+# Vuelca las posiciones pendientes al terminar el proceso (también tras SIGTERM: bot.main lo convierte
+# en una salida normal con sys.exit para que se ejecuten los manejadores de atexit).
+atexit.register(flush)
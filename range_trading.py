@@ -14,7 +14,7 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def detectar_rango_lateral(client, symbol, periodo=20, adx_umbral=25, band_width_max=0.05):
+def detectar_rango_lateral(client, symbol, periodo=20, adx_umbral=25, band_width_max=0.05, klines=None):
     """
     Detecta si el mercado está en rango lateral usando:
     - ADX < adx_umbral (falta de tendencia)
@@ -26,17 +26,22 @@ def detectar_rango_lateral(client, symbol, periodo=20, adx_umbral=25, band_width
         periodo: Período para cálculo de indicadores.
         adx_umbral: Valor máximo de ADX para considerar rango.
         band_width_max: Ancho máximo de bandas (relativo al precio).
+        klines: Velas de 1H ya descargadas (las más recientes). Si es None, se piden a Binance.
 
     Returns:
         tuple: (en_rango, soporte, resistencia)
     """
     try:
         # Obtener datos históricos (1H para mayor precisión)
-        klines = client.get_klines(
-            symbol=symbol,
-            interval=Client.KLINE_INTERVAL_1HOUR,
-            limit=periodo + 14  # Datos extra para ADX
-        )
+        if klines is None:
+            klines = client.get_klines(
+                symbol=symbol,
+                interval=Client.KLINE_INTERVAL_1HOUR,
+                limit=periodo + 14  # Datos extra para ADX
+            )
+        else:
+            # Velas precargadas: solo las necesarias, igual que con la petición directa.
+            klines = klines[-(periodo + 14):]
 
         if len(klines) < periodo + 14:
             logging.warning(f"Datos insuficientes para {symbol}")
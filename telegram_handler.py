@@ -2,6 +2,8 @@
 import requests
 # Importa el módulo json para trabajar con datos en formato JSON (serialización/deserialización).
 import json
+# Importa orjson para serializar el payload de los mensajes más rápido que json en el hilo de envío.
+import orjson
 # Importa el módulo logging para registrar eventos y mensajes del bot.
 import logging
 # Importa el módulo os para interactuar con el sistema operativo, como la gestión de archivos (os.path.exists, os.remove).
@@ -10,6 +12,14 @@ import os
 import csv
 import html  # Importa el módulo html para escapar caracteres HTML.
 import math  # Importa el módulo math para funciones como isnan e isinf.
+# Importa atexit para enviar los mensajes pendientes al cerrar el proceso.
+import atexit
+# Importa queue para encolar los mensajes y enviarlos fuera del camino crítico del trading.
+import queue
+# Importa threading para el hilo de envío en segundo plano.
+import threading
+# Importa time para el limitador de envíos (token bucket) y las esperas por 429.
+import time
 # Mover la importación aquí para que sea accesible globalmente en el módulo.
 import binance_utils
 import config_manager
@@ -19,6 +29,29 @@ import config_manager
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Sesión HTTP reutilizable (keep-alive): todos los mensajes comparten la misma conexión TCP+TLS
+# con api.telegram.org en lugar de abrir una nueva por mensaje.
+_session = requests.Session()
+# Tamaño máximo de la cola de mensajes: si se llena, los nuevos mensajes se descartan con un aviso.
+TELEGRAM_QUEUE_MAXSIZE = 1000
+# Límites de Telegram: ~30 mensajes/s globales (se usa 25 de margen) y 1 mensaje/s por chat.
+TELEGRAM_TASA_GLOBAL = 25.0
+TELEGRAM_TASA_POR_CHAT = 1.0
+# Cabeceras del cuerpo JSON ya serializado con orjson.
+_CABECERAS_JSON = {'Content-Type': 'application/json'}
+# Reintentos máximos de un mensaje rechazado con 429 (Too Many Requests).
+TELEGRAM_MAX_REINTENTOS_429 = 3
+# Segundos máximos que se espera a que se vacíe la cola (al cerrar el bot o antes de enviar un documento).
+TELEGRAM_VACIADO_TIMEOUT = 15
+# Cola FIFO de mensajes pendientes: elementos (token, chat_id, message), enviados en orden de llegada.
+_cola_mensajes = queue.Queue(maxsize=TELEGRAM_QUEUE_MAXSIZE)
+# Estado de los token buckets: {clave: [tokens_disponibles, ultimo_timestamp]}.
+_buckets = {}
+# Hilo de envío en segundo plano (se inicia bajo demanda con el primer mensaje encolado).
+_hilo_envio = None
+# Lock para evitar que se inicien dos hilos de envío a la vez.
+_hilo_envio_lock = threading.Lock()
+
 
 def _escape_html_entities(text):
     """
@@ -46,7 +79,10 @@ def _escape_html_entities(text):
 
 def send_telegram_message(token, chat_id, message):
     """
-    Envía un mensaje de texto al chat de Telegram configurado.
+    Encola un mensaje de texto para el chat de Telegram configurado.
+    El envío HTTPS lo realiza un hilo en segundo plano que respeta los límites de Telegram
+    (token bucket global y por chat), de modo que la lógica de trading no espera a Telegram.
+    Los mensajes se envían en el mismo orden en que se encolan.
     Permite formato HTML básico (ej. <b> para negrita, <code> para código) para mejorar la legibilidad.
 
     Args:
@@ -55,7 +91,7 @@ def send_telegram_message(token, chat_id, message):
         message (str): El texto del mensaje a enviar.
 
     Returns:
-        bool: True si el mensaje se envió con éxito, False en caso contrario.
+        bool: True si el mensaje se encoló con éxito, False si no es válido, falta configuración o la cola está llena.
     """
     # Verifica si el token o el chat_id no están configurados.
     # --- AÑADE ESTO AL PRINCIPIO DE send_telegram_message ---
@@ -70,6 +106,93 @@ def send_telegram_message(token, chat_id, message):
             "⚠️ TOKEN o CHAT_ID de Telegram no configurados. No se pueden enviar mensajes.")
         return False
 
+    global _hilo_envio
+    with _hilo_envio_lock:
+        if _hilo_envio is None or not _hilo_envio.is_alive():
+            _hilo_envio = threading.Thread(
+                target=_enviador_telegram, daemon=True)
+            _hilo_envio.start()
+    try:
+        _cola_mensajes.put_nowait((token, chat_id, message))
+    except queue.Full:
+        logging.warning(
+            f"⚠️ Cola de Telegram llena ({TELEGRAM_QUEUE_MAXSIZE} mensajes). Se descarta el mensaje.")
+        return False
+    return True
+
+
+def _esperar_token(clave, tasa):
+    """
+    Token bucket: espera hasta que haya un token disponible para 'clave' y lo consume.
+    La capacidad del bucket es igual a la tasa (permite ráfagas de un segundo).
+    """
+    tokens, ultimo = _buckets.get(clave, (tasa, time.time()))
+    ahora = time.time()
+    tokens = min(tasa, tokens + (ahora - ultimo) * tasa)
+    if tokens < 1.0:
+        time.sleep((1.0 - tokens) / tasa)
+        ahora = time.time()
+        tokens = 1.0
+    _buckets[clave] = [tokens - 1.0, ahora]
+
+
+def _enviador_telegram():
+    """
+    Bucle del hilo de envío: espera mensajes en la cola y los envía uno a uno,
+    respetando el límite por chat y el límite global.
+    """
+    while True:
+        token, chat_id, message = _cola_mensajes.get()
+        try:
+            _esperar_token(('chat', chat_id), TELEGRAM_TASA_POR_CHAT)
+            _esperar_token('global', TELEGRAM_TASA_GLOBAL)
+            _enviar_mensaje_ahora(token, chat_id, message)
+        except Exception as e:
+            logging.error(
+                f"❌ Error inesperado en el hilo de envío de Telegram: {e}", exc_info=True)
+        finally:
+            _cola_mensajes.task_done()
+
+
+def vaciar_cola_mensajes(timeout=TELEGRAM_VACIADO_TIMEOUT):
+    """
+    Espera a que se envíen los mensajes pendientes, como máximo 'timeout' segundos. Se registra
+    con atexit para no perder notificaciones (p. ej. de una venta) al cerrar el bot, sin que un
+    Telegram caído o lento pueda bloquear el cierre indefinidamente.
+
+    Args:
+        timeout (float, optional): Segundos máximos de espera.
+
+    Returns:
+        bool: True si la cola quedó vacía, False si se agotó el tiempo con mensajes pendientes.
+    """
+    if _hilo_envio is None or not _hilo_envio.is_alive():
+        return True
+    limite = time.time() + timeout
+    # Equivale a _cola_mensajes.join(), pero con un plazo máximo.
+    with _cola_mensajes.all_tasks_done:
+        while _cola_mensajes.unfinished_tasks:
+            restante = limite - time.time()
+            if restante <= 0:
+                logging.warning(
+                    f"⚠️ Tiempo agotado esperando la cola de Telegram: "
+                    f"{_cola_mensajes.unfinished_tasks} mensajes sin enviar.")
+                return False
+            _cola_mensajes.all_tasks_done.wait(restante)
+    return True
+
+
+atexit.register(vaciar_cola_mensajes)
+
+
+def _enviar_mensaje_ahora(token, chat_id, message):
+    """
+    Envía de forma síncrona un mensaje a Telegram usando la sesión HTTP compartida.
+    Si Telegram responde 429 (Too Many Requests), espera el 'retry_after' indicado y reintenta.
+
+    Returns:
+        bool: True si el mensaje se envió con éxito, False en caso contrario.
+    """
     # Inicializa response a None para asegurar que siempre esté definida.
     response = None
     # Construye la URL para la API de Telegram.
@@ -82,9 +205,24 @@ def send_telegram_message(token, chat_id, message):
         # Permite usar etiquetas HTML en el mensaje para formato.
         'parse_mode': 'HTML'
     }
+    # Serializa una sola vez con orjson (devuelve bytes); se reutiliza en los reintentos por 429.
+    cuerpo = orjson.dumps(payload)
     try:
-        # Envía la solicitud POST a la API de Telegram.
-        response = requests.post(url, json=payload)
+        for _ in range(TELEGRAM_MAX_REINTENTOS_429):
+            # Envía la solicitud POST a la API de Telegram reutilizando la conexión de la sesión.
+            response = _session.post(
+                url, data=cuerpo, headers=_CABECERAS_JSON, timeout=30)
+            if response.status_code != 429:
+                break
+            # Límite excedido: Telegram indica cuántos segundos esperar antes de reintentar.
+            try:
+                retry_after = response.json().get(
+                    'parameters', {}).get('retry_after', 1)
+            except ValueError:
+                retry_after = 1
+            logging.warning(
+                f"⚠️ Telegram devolvió 429. Reintentando en {retry_after}s.")
+            time.sleep(retry_after)
         # Lanza una excepción HTTPError si la respuesta no fue exitosa (código de estado 4xx o 5xx).
         response.raise_for_status()
         return True  # Retorna True si la solicitud fue exitosa.
@@ -118,6 +256,8 @@ def send_telegram_document(token, chat_id, file_path, caption=""):
         logging.warning(
             "⚠️ TOKEN de Telegram no configurado. No se pueden enviar documentos.")
         return False
+    # Espera a que salgan los mensajes encolados para que el documento llegue después de ellos.
+    vaciar_cola_mensajes()
 
     # Inicializa response a None para asegurar que siempre esté definida.
     response = None
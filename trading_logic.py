@@ -2,10 +2,13 @@ import config_manager  # Para guardar bot_params actualizado.
 import telegram_handler  # Importar telegram_handler para usar _escape_html_entities
 import position_manager
 import binance_utils
+import klines_cache  # Caché en disco de velas cerradas.
 # Importa el módulo logging para registrar eventos y mensajes informativos, de advertencia o error.
 import logging
 # Importa el módulo time para funciones relacionadas con el tiempo.
 import time
+# Importa el pool de hilos para calcular los indicadores de varios símbolos en paralelo.
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json  # Importa el módulo json para trabajar con datos en formato JSON.
 # Importa todas las enumeraciones de Binance (ej. KLINE_INTERVAL_1MINUTE) para mayor comodidad.
 from binance.enums import *
@@ -15,8 +18,16 @@ from datetime import datetime, timedelta
 import firestore_utils
 # Importa el módulo os para interactuar con el sistema operativo, como acceder a variables de entorno.
 import os
-# Importa la excepción específica de Binance API.
-from binance.exceptions import BinanceAPIException
+# Importa las excepciones específicas de Binance API (errores de la API y respuestas inválidas).
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+# Importa requests para capturar sus errores de red (timeouts, conexión) de forma específica.
+import requests
+# Importa lru_cache para memorizar los símbolos ya escapados para HTML.
+from functools import lru_cache
+# Importa numpy para manejar los precios de cierre como un array contiguo (float64) para los kernels de Numba.
+import numpy as np
+# Importa el decorador njit de Numba para compilar los bucles numéricos de los indicadores.
+from numba import njit
 
 # Configura el sistema de registro para este módulo.
 logging.basicConfig(level=logging.INFO,
@@ -30,12 +41,451 @@ logging.basicConfig(level=logging.INFO,
 # '__app_id' es una variable de entorno proporcionada por el entorno de Canvas/Railway.
 FIRESTORE_TRANSACTIONS_COLLECTION_PATH = f"artifacts/{os.getenv('__app_id', 'default-app-id')}/public/data/transactions_history"
 
+# Número máximo de hilos para calcular en paralelo los indicadores de varios símbolos.
+MAX_WORKERS_INDICADORES = 20
 
-def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_periodo_larga, rsi_periodo):
+# Buffer sobre el saldo USDT para comisiones y precisión (0.15%), y el factor derivado que se aplica
+# al saldo; se calculan una sola vez y los comparten calcular_cantidad_a_comprar y comprar.
+BUFFER_PORCENTAJE = 0.0015
+FACTOR_SALDO_CON_BUFFER = 1 - BUFFER_PORCENTAJE
+
+
+@lru_cache(maxsize=256)
+def _esc_symbol(symbol):
+    """
+    Devuelve el símbolo escapado para HTML, memorizado: los símbolos operados son pocos y
+    se repiten en cada notificación, así que se escapan una sola vez.
+
+    Args:
+        symbol (str): El par de trading (ej. "BTCUSDT").
+
+    Returns:
+        str: El símbolo con los caracteres HTML escapados.
+    """
+    return telegram_handler._escape_html_entities(symbol)
+
+
+# Último timestamp formateado, cacheado por segundo: (segundo_epoch, cadena_iso).
+# Se reemplaza la tupla completa para que otro hilo nunca lea un par inconsistente.
+_ultimo_timestamp = (0, "")
+
+
+def _ahora_iso():
+    """
+    Devuelve la hora local actual en formato ISO con resolución de segundos (ej. "2024-05-01T12:00:00").
+    Las operaciones en ráfaga dentro del mismo segundo reutilizan la cadena ya formateada.
+
+    Returns:
+        str: La marca de tiempo en formato ISO.
+    """
+    global _ultimo_timestamp
+    segundo = int(time.time())
+    if segundo != _ultimo_timestamp[0]:
+        _ultimo_timestamp = (segundo, datetime.fromtimestamp(
+            segundo).isoformat(timespec='seconds'))
+    return _ultimo_timestamp[1]
+
+
+def precio_medio_ejecucion(order):
+    """
+    Calcula el precio medio ponderado por volumen (VWAP) y la cantidad total de una orden
+    a partir de todos sus 'fills', en lugar de tomar solo el precio de la primera ejecución.
+
+    Args:
+        order (dict): Respuesta de la orden de Binance.
+
+    Returns:
+        tuple: (precio_medio, cantidad_total). Si la orden no trae 'fills', se usan
+               'cummulativeQuoteQty' / 'executedQty'; (0.0, 0.0) si no se ejecutó nada.
+    """
+    fills = order.get('fills', [])
+    if fills:
+        precios = np.fromiter((float(f['price']) for f in fills),
+                              dtype=np.float64, count=len(fills))
+        cantidades = np.fromiter((float(f['qty']) for f in fills),
+                                 dtype=np.float64, count=len(fills))
+        cantidad_total = float(cantidades.sum())
+        if cantidad_total > 0:
+            return float(np.dot(precios, cantidades) / cantidad_total), cantidad_total
+    # Sin fills (p. ej. respuesta ACK/RESULT): se deriva del total en USDT y la cantidad ejecutada.
+    cantidad_total = float(order.get('executedQty', 0))
+    if cantidad_total > 0:
+        return float(order.get('cummulativeQuoteQty', 0)) / cantidad_total, cantidad_total
+    return 0.0, 0.0
+
+
+@njit(cache=True, fastmath=True)
+def _ema_nb(prices, period, sf):
+    """
+    Calcula el último valor de la EMA sobre los precios de cierre (compilado con Numba).
+    Un único kernel para todos los períodos: el período y el factor de suavizado son argumentos,
+    así que se compila (y se cachea en disco) una sola vez.
+
+    Args:
+        prices (np.ndarray): Precios de cierre (float64, contiguo). Debe tener al menos 'period' elementos.
+        period (int): Período de la EMA.
+        sf (float): Factor de suavizado, 2 / (period + 1).
+
+    Returns:
+        float: El último valor de la EMA, inicializada con la media simple de los primeros 'period' precios.
+    """
+    one_minus_sf = 1.0 - sf
+    # Semilla SMA de los primeros 'period' precios.
+    ema = 0.0
+    for i in range(period):
+        ema += prices[i]
+    ema /= period
+    for i in range(period, prices.size):
+        ema = sf * prices[i] + one_minus_sf * ema
+    return ema
+
+
+@njit(cache=True, fastmath=True)
+def _indicadores_nb(prices, periodo_corta, periodo_media, periodo_larga, rsi_periodo):
+    """
+    Calcula las tres EMAs y los promedios de Wilder del RSI en una sola pasada sobre los precios
+    (compilado con Numba). Cada precio se lee una vez y actualiza a la vez los cinco acumuladores,
+    en lugar de recorrer el array cuatro veces.
+
+    Args:
+        prices (np.ndarray): Precios de cierre (float64, contiguo). Debe tener al menos tantos elementos
+            como el período EMA más largo y al menos rsi_periodo + 1.
+        periodo_corta (int): Período de la EMA corta.
+        periodo_media (int): Período de la EMA media.
+        periodo_larga (int): Período de la EMA larga.
+        rsi_periodo (int): Período del RSI.
+
+    Returns:
+        tuple: (ema_corta, ema_media, ema_larga, avg_gain, avg_loss) tras el último precio.
+    """
+    periodos = np.array([periodo_corta, periodo_media, periodo_larga])
+    sfs = 2.0 / (periodos + 1.0)
+    # Mientras i < período, el acumulador de cada EMA suma precios para la semilla SMA.
+    emas = np.zeros(3, dtype=np.float64)
+    # Invariantes del bucle: se calculan una vez y se multiplica en lugar de dividir en cada paso.
+    inv_n = 1.0 / rsi_periodo
+    n_minus_1 = rsi_periodo - 1
+    avg_gain = 0.0
+    avg_loss = 0.0
+
+    for i in range(prices.size):
+        price = prices[i]
+        for j in range(3):
+            if i < periodos[j]:
+                emas[j] += price
+                if i == periodos[j] - 1:
+                    emas[j] /= periodos[j]
+            else:
+                emas[j] += sfs[j] * (price - emas[j])
+
+        if i > 0:
+            # Separación sin ramas de ganancia y pérdida del cambio de precio.
+            difference = price - prices[i - 1]
+            abs_difference = abs(difference)
+            gain = 0.5 * (difference + abs_difference)
+            loss = 0.5 * (abs_difference - difference)
+            if i <= rsi_periodo:
+                # Promedio inicial sobre los primeros 'rsi_periodo' cambios de precio.
+                avg_gain += gain
+                avg_loss += loss
+                if i == rsi_periodo:
+                    avg_gain *= inv_n
+                    avg_loss *= inv_n
+            else:
+                # Suavizado de Wilder para el resto de los datos.
+                avg_gain = (avg_gain * n_minus_1 + gain) * inv_n
+                avg_loss = (avg_loss * n_minus_1 + loss) * inv_n
+    return emas[0], emas[1], emas[2], avg_gain, avg_loss
+
+
+@njit(cache=True, fastmath=True)
+def _rsi_nb(precios, periodo):
+    """
+    Calcula los promedios de Wilder del RSI directamente sobre los precios de cierre, en una sola
+    pasada y sin arrays intermedios de diferencias, ganancias y pérdidas (compilado con Numba).
+
+    Args:
+        precios (np.ndarray): Precios de cierre (contiguo). Debe tener al menos 'periodo' + 1 elementos.
+        periodo (int): Período del RSI.
+
+    Returns:
+        tuple: (avg_gain, avg_loss) tras el último precio.
+    """
+    inv_n = 1.0 / periodo
+    n_minus_1 = periodo - 1
+    # Promedios iniciales sobre los primeros 'periodo' cambios de precio.
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, periodo + 1):
+        d = float(precios[i]) - float(precios[i - 1])
+        avg_gain += max(d, 0.0)
+        avg_loss += max(-d, 0.0)
+    avg_gain *= inv_n
+    avg_loss *= inv_n
+    # Suavizado de Wilder para el resto de los precios.
+    for i in range(periodo + 1, precios.size):
+        d = float(precios[i]) - float(precios[i - 1])
+        avg_gain = (avg_gain * n_minus_1 + max(d, 0.0)) * inv_n
+        avg_loss = (avg_loss * n_minus_1 + max(-d, 0.0)) * inv_n
+    return avg_gain, avg_loss
+
+
+# Tipo de dato de los arrays de precios de cierre que reciben los kernels de Numba. Se usa float64:
+# con float32 el RSI se desvía hasta ~6e-4 en precios altos (p. ej. ~67000 con 2 decimales) y la
+# siembra no coincidiría con las actualizaciones incrementales, que se hacen en float64.
+PRECIOS_DTYPE = np.float64
+
+def _rsi_desde_promedios(avg_gain, avg_loss):
+    """
+    Calcula el RSI a partir de la ganancia y pérdida promedio con la fórmula canónica.
+    Sin pérdidas el RSI es 100 y, si tampoco hay ganancias (mercado plano), 50 (neutral).
+    No se usa un épsilon absoluto: en activos de precio muy bajo los promedios son del orden
+    de 1e-9 a 1e-12 y cualquier épsilon fijo sesgaría el resultado.
+    """
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else 50.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+def calcular_rsi(close_prices, rsi_periodo):
+    """
+    Calcula el RSI de Wilder sobre un array de precios de cierre.
+    Diferencias, ganancias, pérdidas y suavizado de Wilder se fusionan en una sola pasada
+    en el kernel de Numba _rsi_nb.
+
+    Args:
+        close_prices (array-like): Precios de cierre.
+        rsi_periodo (int): Período del RSI.
+
+    Returns:
+        float or None: El último valor del RSI, o None si no hay suficientes precios.
+    """
+    precios = np.ascontiguousarray(close_prices, dtype=np.float64)
+    if rsi_periodo <= 0 or precios.size - 1 < rsi_periodo:
+        return None
+    avg_gain, avg_loss = _rsi_nb(precios, rsi_periodo)
+    return _rsi_desde_promedios(float(avg_gain), float(avg_loss))
+
+
+def calcular_ema(prices, period):
+    """
+    Calcula el último valor de la EMA sobre un array de precios de cierre con el kernel de Numba _ema_nb.
+
+    Args:
+        prices (array-like): Precios de cierre.
+        period (int): Período de la EMA.
+
+    Returns:
+        float or None: El último valor de la EMA, o None si el período no es válido o no hay suficientes precios.
+    """
+    if period <= 0 or len(prices) < period:
+        return None
+    precios = np.ascontiguousarray(prices, dtype=PRECIOS_DTYPE)
+    return float(_ema_nb(precios, period, 2.0 / (period + 1)))
+
+
+def _precalentar_kernels():
+    """
+    Ejecuta una vez los kernels de Numba con datos ficticios al importar el módulo, para que
+    la compilación JIT (o la carga desde la caché en disco) no ocurra en el primer ciclo de trading.
+    """
+    try:
+        precios = np.linspace(1.0, 2.0, 32).astype(PRECIOS_DTYPE)
+        _indicadores_nb(precios, 3, 5, 8, 14)
+        _rsi_nb(precios, 14)
+        _ema_nb(precios, 9, 2.0 / 10)
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudieron precalentar los kernels de Numba: {e}")
+
+
+_precalentar_kernels()
+
+
+# Estado incremental de los indicadores, indexado por (symbol, ema_corta, ema_media, ema_larga, rsi).
+# Guarda los valores de las EMAs y los promedios de Wilder calculados hasta la última vela CERRADA,
+# de modo que en cada ciclo solo se descargan y procesan las velas nuevas (O(1) por vela).
+_indicator_state = {}
+
+
+def _calcular_estado(close_prices, periodos):
+    """
+    Calcula desde cero el estado de los indicadores sobre un array de precios de cierre.
+    El llamador garantiza que hay precios suficientes para todos los períodos.
+
+    Args:
+        close_prices (np.ndarray): Precios de cierre (float64, contiguo).
+        periodos (tuple): (ema_periodo_corta, ema_periodo_media, ema_periodo_larga, rsi_periodo).
+
+    Returns:
+        dict: Estado con 'ema_corta', 'ema_media', 'ema_larga', 'avg_gain', 'avg_loss' y 'last_close'.
+    """
+    ema_corta, ema_media, ema_larga, avg_gain, avg_loss = _indicadores_nb(
+        close_prices, *periodos)
+    return {
+        'ema_corta': float(ema_corta),
+        'ema_media': float(ema_media),
+        'ema_larga': float(ema_larga),
+        'avg_gain': float(avg_gain),
+        'avg_loss': float(avg_loss),
+        'last_close': float(close_prices[-1])
+    }
+
+
+# Constantes de suavizado ya calculadas, indexadas por la tupla de períodos.
+_constantes_suavizado = {}
+
+
+def _obtener_constantes_suavizado(periodos):
+    """
+    Devuelve (sf_corta, sf_media, sf_larga, rsi_n_menos_1, rsi_inv_n) para una tupla de períodos,
+    calculándolas solo la primera vez.
+    """
+    constantes = _constantes_suavizado.get(periodos)
+    if constantes is None:
+        ema_periodo_corta, ema_periodo_media, ema_periodo_larga, rsi_periodo = periodos
+        constantes = _constantes_suavizado[periodos] = (
+            2 / (ema_periodo_corta + 1), 2 / (ema_periodo_media + 1), 2 / (ema_periodo_larga + 1),
+            rsi_periodo - 1, 1.0 / rsi_periodo)
+    return constantes
+
+
+def _avanzar_estado(estado, close, periodos):
+    """
+    Aplica un único paso de EMA y de suavizado de Wilder con un nuevo precio de cierre.
+    No modifica el estado recibido; devuelve uno nuevo.
+    """
+    sf_corta, sf_media, sf_larga, n_minus_1, inv_n = _obtener_constantes_suavizado(
+        periodos)
+    nuevo = dict(estado)
+    for clave, smoothing_factor in (('ema_corta', sf_corta), ('ema_media', sf_media), ('ema_larga', sf_larga)):
+        if nuevo[clave] is not None:
+            nuevo[clave] += smoothing_factor * (close - nuevo[clave])
+    difference = close - estado['last_close']
+    nuevo['avg_gain'] = ((estado['avg_gain'] * n_minus_1) +
+                         max(difference, 0.0)) * inv_n
+    nuevo['avg_loss'] = ((estado['avg_loss'] * n_minus_1) +
+                         max(-difference, 0.0)) * inv_n
+    nuevo['last_close'] = close
+    return nuevo
+
+
+def _velas_cacheadas_en_ventana(symbol, start_str_ms):
+    """
+    Devuelve las velas cerradas de la caché en disco que caen dentro de la ventana de cálculo
+    y el timestamp desde el que hay que descargar velas nuevas.
+    """
+    velas_cacheadas = [k for k in klines_cache.load(
+        symbol, KLINE_INTERVAL_1MINUTE) if k[0] >= start_str_ms]
+    inicio_descarga_ms = velas_cacheadas[-1][0] + \
+        60_000 if velas_cacheadas else start_str_ms
+    return velas_cacheadas, inicio_descarga_ms
+
+
+def _descargar_klines(client, symbol, inicio_ms, velas_precargadas=None):
+    """
+    Obtiene las velas de 1 minuto de un símbolo desde 'inicio_ms'.
+    Si hay velas precargadas por precargar_klines que cubren ese inicio, se filtran localmente
+    sin hacer ninguna petición a Binance.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbol (str): El par de trading (ej. "BTCUSDT").
+        inicio_ms (int): Timestamp en milisegundos de la primera vela requerida.
+        velas_precargadas (tuple, optional): (inicio_precarga_ms, velas, descarga_ms) devuelto por precargar_klines.
+
+    Returns:
+        list: Velas en el formato de la API de Binance.
+    """
+    if velas_precargadas is not None:
+        inicio_precarga_ms, velas, _ = velas_precargadas
+        if inicio_precarga_ms <= inicio_ms:
+            return [k for k in velas if k[0] >= inicio_ms]
+    # Una sola petición a /klines con el número exacto de velas; solo se pagina si superan el máximo por petición.
+    limite = binance_utils.limite_velas_desde(inicio_ms, KLINE_INTERVAL_1MINUTE)
+    if limite is None:
+        return client.get_historical_klines(symbol, KLINE_INTERVAL_1MINUTE, inicio_ms)
+    return client.get_klines(symbol=symbol, interval=KLINE_INTERVAL_1MINUTE, startTime=inicio_ms, limit=limite)
+
+
+def podar_estado_indicadores(periodos_activos):
+    """
+    Descarta el estado incremental de los indicadores cuyos períodos ya no se calculan.
+
+    Args:
+        periodos_activos (dict): {symbol: conjunto de tuplas de períodos} en uso.
+    """
+    for clave in list(_indicator_state):
+        if clave[1:] not in periodos_activos.get(clave[0], ()):
+            _indicator_state.pop(clave, None)
+
+
+def precargar_klines(client, symbols, max_periodo, start_ms=None, periodos_activos=None):
+    """
+    Descarga en un solo barrido concurrente (AsyncClient + asyncio.gather) las velas que necesitará
+    calcular_ema_rsi para todos los símbolos en este ciclo.
+    Para cada símbolo solo se piden las velas posteriores a su estado incremental o a su caché en disco.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbols (list): Lista de pares de trading.
+        max_periodo (int): Período más largo de los indicadores que se calcularán.
+        start_ms (int, optional): Inicio de la ventana de velas calculado una vez por ciclo.
+            Si es None, se calcula a partir de max_periodo.
+        periodos_activos (dict, optional): {symbol: conjunto de tuplas de períodos} que se calcularán
+            en este ciclo. Si se indica, se descarta el estado incremental de los períodos que ya no se
+            usan (p. ej. tras un /set_*) y el inicio de la descarga solo depende de los activos.
+
+    Returns:
+        dict: {symbol: (inicio_precarga_ms, velas, descarga_ms)} para pasar a calcular_ema_rsi, donde
+        descarga_ms es el momento en que empezó la descarga. Vacío si la descarga falla.
+        Como efecto secundario, el cierre de la vela en curso de cada símbolo queda en la caché de
+        obtener_precio_actual durante PRECIO_SALDO_CACHE_TTL segundos.
+    """
+    start_str_ms = start_ms if start_ms is not None else int(
+        (datetime.now() - timedelta(minutes=max_periodo + 50)).timestamp() * 1000)
+    if periodos_activos is not None:
+        podar_estado_indicadores(periodos_activos)
+    inicios_ms = {}
+    for symbol in symbols:
+        if periodos_activos is not None:
+            claves = [(symbol,) + periodos for periodos in periodos_activos.get(symbol, ())]
+        else:
+            claves = [clave for clave in list(_indicator_state) if clave[0] == symbol]
+        # Cada conjunto de períodos necesita las velas posteriores a su estado incremental o, si aún no
+        # tiene estado, las posteriores a su caché en disco; se descarga desde la más antigua de ellas.
+        # Nunca antes del inicio de la ventana: un estado más antiguo se vuelve a sembrar en lugar de
+        # ponerse al día vela a vela.
+        inicios = [_indicator_state[clave]['last_kline_open_time'] + 60_000
+                   for clave in claves if clave in _indicator_state]
+        if not claves or len(inicios) < len(claves):
+            inicios.append(_velas_cacheadas_en_ventana(symbol, start_str_ms)[1])
+        inicios_ms[symbol] = max(min(inicios), start_str_ms)
+    # Momento de la descarga: una vela cuyo cierre sea posterior pudo llegar aún en formación.
+    descarga_ms = int(time.time() * 1000)
+    try:
+        velas_por_simbolo = binance_utils.descargar_klines(
+            client, inicios_ms, KLINE_INTERVAL_1MINUTE)
+    except Exception as e:
+        logging.error(
+            f"❌ Error en la descarga concurrente de velas: {e}", exc_info=True)
+        return {}
+    # El cierre de la vela en curso es el último precio negociado: se guarda en la caché de precios
+    # para que obtener_precio_actual no repita una petición de ticker por símbolo en este ciclo.
+    ahora_ms = int(time.time() * 1000)
+    for symbol, velas in velas_por_simbolo.items():
+        if velas and int(velas[-1][6]) >= ahora_ms:
+            binance_utils.obtener_precio_actual.cache_put(
+                float(velas[-1][4]), client, symbol)
+    return {symbol: (inicios_ms[symbol], velas, descarga_ms) for symbol, velas in velas_por_simbolo.items()}
+
+
+def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_periodo_larga, rsi_periodo, velas_precargadas=None, start_ms=None):
     """
     Calcula la Media Móvil Exponencial (EMA) corta, EMA media, EMA larga y el Índice de Fuerza Relativa (RSI)
     para un símbolo dado.
     Requiere el cliente de Binance y los períodos para cada indicador.
+    La primera llamada para un símbolo y conjunto de períodos descarga el historial completo y guarda el estado
+    de los indicadores; las siguientes solo descargan las velas nuevas y las aplican de forma incremental.
 
     Args:
         client: Instancia del cliente de Binance.
@@ -44,6 +494,11 @@ def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_p
         ema_periodo_media (int): Período para la EMA media.
         ema_periodo_larga (int): Período para la EMA larga.
         rsi_periodo (int): Período para el cálculo del RSI.
+        velas_precargadas (tuple, optional): (inicio_precarga_ms, velas, descarga_ms) de precargar_klines. Si cubren
+            las velas necesarias, no se hace ninguna petición a Binance.
+        start_ms (int, optional): Inicio de la ventana de velas en milisegundos, calculado una vez por
+            ciclo por el llamador para que todos los símbolos compartan la misma ventana.
+            Si es None, o si no cubre el período más largo de este símbolo, se calcula a partir de él.
 
     Returns:
         tuple: Una tupla que contiene (ema_corta_valor, ema_media_valor, ema_larga_valor, rsi_valor).
@@ -54,7 +509,17 @@ def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_p
         # Se obtienen suficientes velas para la EMA más larga y el RSI, más un buffer.
         max_periodo = max(ema_periodo_corta, ema_periodo_media,
                           ema_periodo_larga, rsi_periodo)
-
+        periodos = (ema_periodo_corta, ema_periodo_media,
+                    ema_periodo_larga, rsi_periodo)
+        clave_estado = (symbol,) + periodos
+        estado = _indicator_state.get(clave_estado)
+        # Una vela se considera cerrada si su hora de cierre (k[6]) ya había pasado cuando se descargó:
+        # con velas precargadas, el corte es el momento de la descarga y no el actual, porque una vela que
+        # estaba en formación al descargarse trae un cierre parcial que no debe persistirse en el estado
+        # ni en la caché en disco.
+        ahora_ms = int(time.time() * 1000)
+        corte_ms = ahora_ms if velas_precargadas is None else min(
+            ahora_ms, velas_precargadas[2])
         # Calcular el tiempo de inicio en milisegundos
         # Se necesitan suficientes minutos para cubrir el período más largo + un buffer.
         # Por ejemplo, si el período más largo es 200, y queremos 50 velas de buffer,
@@ -62,75 +527,94 @@ def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_p
         start_time = datetime.now() - timedelta(minutes=max_periodo + 50)
         # Convertir el objeto datetime a milisegundos para la API de Binance.
         start_str_ms = int(start_time.timestamp() * 1000)
+        if start_ms is not None:
+            # La ventana común del ciclo se amplía si los períodos de este símbolo necesitan más velas.
+            start_str_ms = min(start_ms, start_str_ms)
+
+        if estado is not None and estado['last_kline_open_time'] + 60_000 < start_str_ms:
+            # El estado es anterior a la ventana (p. ej. el símbolo dejó de calcularse un tiempo):
+            # se vuelve a sembrar con la ventana en lugar de descargar y aplicar todas las velas perdidas.
+            estado = None
+
+        if estado is not None:
+            # Solo se piden las velas posteriores a la última vela cerrada ya procesada.
+            siguiente_apertura_ms = estado['last_kline_open_time'] + 60_000
+            klines = _descargar_klines(
+                client, symbol, siguiente_apertura_ms, velas_precargadas)
+            # Las velas llegan ordenadas y sin duplicados: son contiguas si la primera es la siguiente
+            # a la última procesada y la última está exactamente len-1 minutos después.
+            if klines and (klines[0][0] != siguiente_apertura_ms or
+                           klines[-1][0] != siguiente_apertura_ms + 60_000 * (len(klines) - 1)):
+                logging.warning(
+                    f"⚠️ Hueco en las velas de {symbol} tras el estado incremental. Se recalculan los indicadores desde la ventana.")
+                _indicator_state.pop(clave_estado, None)
+                estado = None
+            else:
+                velas_cerradas = [k for k in klines if k[6] < corte_ms]
+                for k in velas_cerradas:
+                    estado = _avanzar_estado(estado, float(k[4]), periodos)
+                if velas_cerradas:
+                    estado['last_kline_open_time'] = velas_cerradas[-1][0]
+                    _indicator_state[clave_estado] = estado
+                    klines_cache.append(
+                        symbol, KLINE_INTERVAL_1MINUTE, velas_cerradas)
+                velas_en_formacion = klines[len(velas_cerradas):]
+
+        if estado is None:
+            # Reutilizar las velas cerradas de la caché en disco que caen dentro de la ventana
+            # y descargar solo las posteriores a la última almacenada.
+            velas_cacheadas, inicio_descarga_ms = _velas_cacheadas_en_ventana(
+                symbol, start_str_ms)
+
+            # Una sola petición get_klines con startTime entero y límite exacto (sin parsear fechas
+            # en texto ni paginar); las velas ya precargadas en el ciclo no se vuelven a pedir.
+            velas_nuevas = _descargar_klines(
+                client, symbol, inicio_descarga_ms, velas_precargadas)
+            # La vela en formación es volátil: solo se cachean las cerradas.
+            klines_cache.append(symbol, KLINE_INTERVAL_1MINUTE, [
+                                k for k in velas_nuevas if k[6] < corte_ms])
+            klines = velas_cacheadas + velas_nuevas
+
+            # Extraer los precios de cierre como un array contiguo, convertido una sola vez y compartido
+            # por las tres EMAs y el RSI. NumPy convierte las cadenas de Binance directamente, sin crear
+            # un float de Python intermedio por vela. Se usa float64, la misma precisión que las
+            # actualizaciones incrementales del estado.
+            close_prices = np.array([k[4] for k in klines], dtype=PRECIOS_DTYPE)
+
+            if len(close_prices) < max_periodo:
+                logging.warning(
+                    f"⚠️ No hay suficientes datos para calcular indicadores para {symbol}. Se necesitan al menos {max_periodo} velas, pero se obtuvieron {len(close_prices)}.")
+                return None, None, None, None
 
-        # Usar el timestamp en milisegundos para get_historical_klines
-        klines = client.get_historical_klines(
-            symbol, KLINE_INTERVAL_1MINUTE, start_str_ms)
-
-        # Extraer los precios de cierre de las velas.
-        close_prices = [float(k[4]) for k in klines]
-
-        if len(close_prices) < max_periodo:
-            logging.warning(
-                f"⚠️ No hay suficientes datos para calcular indicadores para {symbol}. Se necesitan al menos {max_periodo} velas, pero se obtuvieron {len(close_prices)}.")
-            return None, None, None, None
-
-        # Función auxiliar interna para calcular una EMA.
-        def calculate_single_ema(prices, period):
-            if period <= 0 or len(prices) < period:
-                return None
-            smoothing_factor = 2 / (period + 1)
-            # Inicializar EMA con el promedio de los primeros 'period' precios
-            # Esto es una forma más robusta de inicializar la EMA para evitar sesgos iniciales.
-            ema = sum(prices[:period]) / period
-            for i in range(period, len(prices)):
-                ema = (prices[i] * smoothing_factor) + \
-                    (ema * (1 - smoothing_factor))
-            return ema
-
-        # Calcular los valores de las tres EMAs.
-        ema_corta_valor = calculate_single_ema(close_prices, ema_periodo_corta)
-        ema_media_valor = calculate_single_ema(close_prices, ema_periodo_media)
-        ema_larga_valor = calculate_single_ema(close_prices, ema_periodo_larga)
-
-        # Calcular RSI.
-        gains = []
-        losses = []
-        for i in range(1, len(close_prices)):
-            difference = close_prices[i] - close_prices[i-1]
-            if difference > 0:
-                gains.append(difference)
-                losses.append(0)
+            if len(close_prices) - 1 < rsi_periodo:
+                logging.warning(
+                    f"⚠️ No hay suficientes datos para calcular RSI para {symbol}. Se necesitan al menos {rsi_periodo} cambios de precio, pero se obtuvieron {len(close_prices) - 1}.")
+                return (calcular_ema(close_prices, ema_periodo_corta),
+                        calcular_ema(close_prices, ema_periodo_media),
+                        calcular_ema(close_prices, ema_periodo_larga),
+                        None)
+
+            # Las velas llegan ordenadas: las cerradas forman un prefijo de la lista.
+            num_cerradas = sum(1 for k in klines if k[6] < corte_ms)
+            if num_cerradas > max_periodo:
+                # Sembrar el estado con las velas cerradas; la vela en formación se aplica aparte.
+                estado = _calcular_estado(
+                    close_prices[:num_cerradas], periodos)
+                estado['last_kline_open_time'] = klines[num_cerradas - 1][0]
+                _indicator_state[clave_estado] = estado
+                velas_en_formacion = klines[num_cerradas:]
             else:
-                gains.append(0)
-                losses.append(abs(difference))
+                # No hay suficientes velas cerradas para guardar estado: cálculo completo sin cachear.
+                estado = _calcular_estado(close_prices, periodos)
+                velas_en_formacion = []
 
-        if len(gains) < rsi_periodo:
-            logging.warning(
-                f"⚠️ No hay suficientes datos para calcular RSI para {symbol}. Se necesitan al menos {rsi_periodo} cambios de precio, pero se obtuvieron {len(gains)}.")
-            return ema_corta_valor, ema_media_valor, ema_larga_valor, None
-
-        # Calcular la ganancia y pérdida promedio inicial.
-        avg_gain = sum(gains[:rsi_periodo]) / rsi_periodo
-        avg_loss = sum(losses[:rsi_periodo]) / rsi_periodo
-
-        # Calcular la ganancia y pérdida promedio suavizada para el resto de los datos.
-        for i in range(rsi_periodo, len(gains)):
-            avg_gain = ((avg_gain * (rsi_periodo - 1)) +
-                        gains[i]) / rsi_periodo
-            avg_loss = ((avg_loss * (rsi_periodo - 1)) +
-                        losses[i]) / rsi_periodo
-
-        # Calcular Relative Strength (RS) y Relative Strength Index (RSI).
-        # Evitar división por cero, asignar inf si solo hay ganancias.
-        rs = avg_gain / \
-            avg_loss if avg_loss != 0 else (
-                float('inf') if avg_gain > 0 else 0)
-        rsi_valor = 100 - (100 / (1 + rs)) if (avg_loss != 0 or avg_gain != 0) and rs != float(
-            # Si ambos son cero, RSI es 50 (neutral).
-            'inf') else (100 if rs == float('inf') else 50)
-
-        return ema_corta_valor, ema_media_valor, ema_larga_valor, rsi_valor
+        # La vela en formación se aplica de forma provisional, sin persistir en el estado.
+        for k in velas_en_formacion:
+            estado = _avanzar_estado(estado, float(k[4]), periodos)
+
+        rsi_valor = _rsi_desde_promedios(
+            estado['avg_gain'], estado['avg_loss'])
+        return estado['ema_corta'], estado['ema_media'], estado['ema_larga'], rsi_valor
 
     except Exception as e:
         logging.error(
@@ -138,6 +622,41 @@ def calcular_ema_rsi(client, symbol, ema_periodo_corta, ema_periodo_media, ema_p
         return None, None, None, None
 
 
+def calcular_indicadores_batch(client, symbols, periodos, velas_precargadas=None, start_ms=None):
+    """
+    Calcula en paralelo con un ThreadPoolExecutor los indicadores (EMAs y RSI) de varios símbolos.
+    El trabajo es sobre todo E/S (peticiones de velas a Binance que liberan el GIL), así que los hilos
+    solapan las esperas de red y comparten el pool de conexiones HTTP del cliente. El envío de tareas
+    pasa por el token bucket de peso de la API para no superar el límite de Binance.
+
+    Args:
+        client: Instancia del cliente de Binance.
+        symbols (list): Pares de trading a calcular.
+        periodos (tuple or dict): (ema_periodo_corta, ema_periodo_media, ema_periodo_larga, rsi_periodo)
+            comunes a todos los símbolos, o {symbol: tupla} con los períodos de cada uno.
+        velas_precargadas (dict, optional): Velas descargadas por precargar_klines.
+        start_ms (int, optional): Inicio de la ventana de velas del ciclo actual.
+
+    Returns:
+        dict: {symbol: (ema_corta, ema_media, ema_larga, rsi)}.
+    """
+    velas_precargadas = velas_precargadas or {}
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS_INDICADORES) as executor:
+        futuros = {}
+        for symbol in symbols:
+            periodos_symbol = periodos[symbol] if isinstance(
+                periodos, dict) else periodos
+            # Con velas precargadas no se hace ninguna petición; solo se limita si hará falta la red.
+            if symbol not in velas_precargadas:
+                binance_utils.esperar_peso_api(binance_utils.PESO_KLINES)
+            futuros[executor.submit(calcular_ema_rsi, client, symbol, *periodos_symbol,
+                                    velas_precargadas.get(symbol), start_ms)] = symbol
+        for futuro in as_completed(futuros):
+            resultados[futuros[futuro]] = futuro.result()
+    return resultados
+
+
 def calcular_cantidad_a_comprar(client, saldo_usdt, precio_actual, stop_loss_porcentaje, symbol, riesgo_por_operacion_porcentaje, capital_total):
     """
     Calcula la cantidad de criptomoneda a comprar basándose en el saldo USDT disponible,
@@ -163,20 +682,20 @@ def calcular_cantidad_a_comprar(client, saldo_usdt, precio_actual, stop_loss_por
 
     # 1. Calcular el monto máximo en USDT que estamos dispuestos a arriesgar en esta operación.
     max_usdt_a_riesgar = capital_total * riesgo_por_operacion_porcentaje
-    logging.info(
-        f"DEBUG: Capital Total: {capital_total:.2f} USDT, Riesgo por Operación: {riesgo_por_operacion_porcentaje*100:.2f}%, Máximo USDT a Arriesgar: {max_usdt_a_riesgar:.2f} USDT")
+    # Los mensajes de depuración usan formato '%' diferido: solo se formatean si el nivel DEBUG está activo.
+    logging.debug("Capital Total: %.2f USDT, Riesgo por Operación: %.2f%%, Máximo USDT a Arriesgar: %.2f USDT",
+                  capital_total, riesgo_por_operacion_porcentaje * 100, max_usdt_a_riesgar)
 
     # 2. Calcular el saldo USDT disponible con un buffer para comisiones.
-    BUFFER_PORCENTAJE = 0.0015  # 0.15% de buffer para comisiones y precisión.
-    saldo_usdt_con_buffer = saldo_usdt * (1 - BUFFER_PORCENTAJE)
-    logging.info(
-        f"DEBUG: Saldo USDT disponible: {saldo_usdt:.2f} USDT, Saldo con buffer ({BUFFER_PORCENTAJE*100:.2f}%): {saldo_usdt_con_buffer:.2f} USDT")
+    saldo_usdt_con_buffer = saldo_usdt * FACTOR_SALDO_CON_BUFFER
+    logging.debug("Saldo USDT disponible: %.2f USDT, Saldo con buffer (%.2f%%): %.2f USDT",
+                  saldo_usdt, BUFFER_PORCENTAJE * 100, saldo_usdt_con_buffer)
 
     # 3. Determinar el presupuesto efectivo para la compra.
     # Es el mínimo entre el riesgo permitido y el saldo disponible con buffer.
     effective_budget_usdt = min(max_usdt_a_riesgar, saldo_usdt_con_buffer)
-    logging.info(
-        f"DEBUG: Presupuesto efectivo para la compra: {effective_budget_usdt:.2f} USDT")
+    logging.debug("Presupuesto efectivo para la compra: %.2f USDT",
+                  effective_budget_usdt)
 
     if effective_budget_usdt <= 0:
         logging.warning(
@@ -185,48 +704,29 @@ def calcular_cantidad_a_comprar(client, saldo_usdt, precio_actual, stop_loss_por
 
     # 4. Calcular la cantidad raw basada en el presupuesto efectivo.
     cantidad_raw = effective_budget_usdt / precio_actual
-    logging.info(
-        f"DEBUG: Cantidad raw basada en presupuesto efectivo: {cantidad_raw:.8f}")
-
-    # 5. Obtener los filtros de Binance.
-    step_size = binance_utils.get_step_size(client, symbol)
-    info = client.get_symbol_info(symbol)
-    min_notional = 0.0
-    min_qty = 0.0
-    for f in info['filters']:
-        if f['filterType'] == 'MIN_NOTIONAL':
-            min_notional = float(f['minNotional'])
-        elif f['filterType'] == 'LOT_SIZE':
-            min_qty = float(f['minQty'])
-
-    # *** NUEVO LOGGING PARA DEPURACIÓN ***
-    logging.info(
-        f"DEBUG: Filters for {symbol}: Step Size={step_size}, Min Qty={min_qty}, Min Notional={min_notional}")
-    # ***********************************
+    logging.debug("Cantidad raw basada en presupuesto efectivo: %.8f",
+                  cantidad_raw)
 
-    # 6. Ajustar la cantidad raw al step_size.
+    # 5. Obtener los filtros de Binance (cacheados por símbolo).
+    step_size, min_qty, min_notional, _ = binance_utils.get_symbol_filters(
+        client, symbol)
+
+    logging.debug("Filters for %s: Step Size=%s, Min Qty=%s, Min Notional=%s",
+                  symbol, step_size, min_qty, min_notional)
+
+    # 6. Ajustar la cantidad raw al step_size (una sola vez).
+    # Como effective_budget_usdt ya es el mínimo entre el riesgo y el saldo con buffer, y el ajuste
+    # redondea hacia abajo, el valor de la orden nunca supera el saldo: no hace falta un segundo ajuste.
+    # Los mínimos min_qty y min_notional se comprueban en la verificación final.
     cantidad_final_ajustada = binance_utils.ajustar_cantidad(
         cantidad_raw, step_size)
-    logging.info(
-        f"DEBUG: Cantidad ajustada por step_size (primera pasada): {cantidad_final_ajustada:.8f}")
-
-    # 7. Bucle para asegurar que el valor de la orden no exceda el saldo disponible.
-    # Reducimos la cantidad en un step_size si el valor total de la orden excede el saldo con buffer.
-    # También nos aseguramos de que la cantidad no caiga por debajo de min_qty o min_notional.
-    while (cantidad_final_ajustada * precio_actual) > saldo_usdt_con_buffer and cantidad_final_ajustada > min_qty:
-        logging.warning(
-            f"⚠️ Valor de orden ({cantidad_final_ajustada * precio_actual:.2f} USDT) excede saldo con buffer ({saldo_usdt_con_buffer:.2f} USDT). Reduciendo cantidad en un step_size.")
-        cantidad_final_ajustada = binance_utils.ajustar_cantidad(
-            cantidad_final_ajustada - step_size, step_size)
-        if cantidad_final_ajustada < min_qty or (cantidad_final_ajustada * precio_actual) < min_notional:
-            logging.warning(
-                f"⚠️ Reducción de cantidad para {symbol} resultó en un valor por debajo de min_qty o min_notional. Abortando compra.")
-            return 0.0
+    logging.debug("Cantidad ajustada por step_size: %.8f",
+                  cantidad_final_ajustada)
 
     # Verificación final después de los ajustes.
-    if cantidad_final_ajustada <= 0 or cantidad_final_ajustada < min_qty or (cantidad_final_ajustada * precio_actual) < min_notional:
+    if not binance_utils.cumple_filtros(cantidad_final_ajustada, precio_actual, min_qty, min_notional):
         logging.warning(
-            f"⚠️ La cantidad final ajustada para {symbol} ({cantidad_final_ajustada:.6f} {symbol.replace('USDT', '')}) es insignificante o resulta en un valor inferior al mínimo nocional ({min_notional} USDT) o min_qty ({min_qty}). Retornando 0.")
+            f"⚠️ La cantidad final ajustada para {symbol} ({cantidad_final_ajustada:.6f} {binance_utils.activo_base(symbol)}) es insignificante o resulta en un valor inferior al mínimo nocional ({min_notional} USDT) o min_qty ({min_qty}). Retornando 0.")
         return 0.0
 
     logging.info(
@@ -234,7 +734,7 @@ def calcular_cantidad_a_comprar(client, saldo_usdt, precio_actual, stop_loss_por
     return cantidad_final_ajustada
 
 
-def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje, transacciones_diarias, telegram_bot_token, telegram_chat_id, open_positions_file):
+def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje, transacciones_diarias, telegram_bot_token, telegram_chat_id, open_positions_file, snapshot=None):
     """
     Ejecuta una orden de compra a precio de mercado en Binance.
     Registra la posición, la transacción y envía una notificación a Telegram.
@@ -249,41 +749,35 @@ def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje,
         telegram_bot_token (str): Token del bot de Telegram.
         telegram_chat_id (str): ID del chat de Telegram.
         open_positions_file (str): Ruta al archivo de posiciones abiertas.
+        snapshot (MarketSnapshot, optional): Precio, saldo USDT y filtros ya tomados con
+            binance_utils.tomar_snapshot al calcular la cantidad. Si es None, se toman aquí.
 
     Returns:
         dict or None: La respuesta de la orden de Binance si fue exitosa, None en caso contrario.
     """
+    # Símbolo escapado para HTML una sola vez (memorizado) para todas las notificaciones.
+    esc_sym = _esc_symbol(symbol)
     try:
         # --- Pre-check robusto antes de colocar la orden ---
-        # Volver a obtener el saldo USDT más reciente justo antes de colocar la orden.
-        latest_saldo_usdt = binance_utils.obtener_saldo_moneda(client, "USDT")
-        latest_precio_actual = binance_utils.obtener_precio_actual(
-            client, symbol)
+        # Se usan los mismos precio, saldo USDT y filtros con los que se calculó la cantidad;
+        # solo si no se recibieron se consultan ahora (en paralelo).
+        if snapshot is None:
+            snapshot = binance_utils.tomar_snapshot(client, symbol)
+        latest_precio_actual, latest_saldo_usdt, filtros = snapshot
 
         if latest_precio_actual <= 0:
             logging.error(
                 f"❌ No se pudo obtener el precio actual para {symbol} justo antes de la compra. Abortando.")
             telegram_handler.send_telegram_message(
-                telegram_bot_token, telegram_chat_id, f"❌ Error: No se pudo obtener precio para <b>{telegram_handler._escape_html_entities(symbol)}</b> antes de comprar.")
+                telegram_bot_token, telegram_chat_id, f"❌ Error: No se pudo obtener precio para <b>{esc_sym}</b> antes de comprar.")
             return None
 
-        # Definir un buffer para comisiones y asegurar que la orden pase.
-        BUFFER_PORCENTAJE = 0.0015  # 0.15% de buffer.
-
         # Calcular la cantidad máxima posible basada en el saldo USDT más reciente y el buffer.
         max_cantidad_posible_por_saldo_latest = (
-            latest_saldo_usdt * (1 - BUFFER_PORCENTAJE)) / latest_precio_actual
-
-        # Obtener los filtros de cantidad mínima y valor nocional de Binance.
-        step_size = binance_utils.get_step_size(client, symbol)
-        info = client.get_symbol_info(symbol)
-        min_notional = 0.0
-        min_qty = 0.0
-        for f in info['filters']:
-            if f['filterType'] == 'MIN_NOTIONAL':
-                min_notional = float(f['minNotional'])
-            elif f['filterType'] == 'LOT_SIZE':
-                min_qty = float(f['minQty'])
+            latest_saldo_usdt * FACTOR_SALDO_CON_BUFFER) / latest_precio_actual
+
+        # Filtros de cantidad mínima y valor nocional de Binance del snapshot.
+        step_size, min_qty, min_notional, _ = filtros
 
         # Tomar el mínimo entre la cantidad calculada por la estrategia y la cantidad máxima posible por saldo.
         final_cantidad_to_buy = min(
@@ -293,25 +787,30 @@ def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje,
             final_cantidad_to_buy, step_size)
 
         # Verificación final contra min_notional y min_qty.
-        if final_cantidad_to_buy <= 0 or final_cantidad_to_buy < min_qty or (final_cantidad_to_buy * latest_precio_actual) < min_notional:
+        if not binance_utils.cumple_filtros(final_cantidad_to_buy, latest_precio_actual, min_qty, min_notional):
             logging.warning(f"⚠️ Compra de {symbol} abortada: Cantidad final ({final_cantidad_to_buy:.8f}) o valor nocional ({final_cantidad_to_buy * latest_precio_actual:.2f} USDT) es insuficiente para la orden. Saldo USDT: {latest_saldo_usdt:.2f}. Min. Nocional: {min_notional:.2f}, Min. Qty: {min_qty:.8f}")
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"⚠️ Compra de <b>{telegram_handler._escape_html_entities(symbol)}</b> abortada: Saldo insuficiente o cantidad/valor mínimo no alcanzado. Saldo USDT: {latest_saldo_usdt:.2f}.")
+                                                   f"⚠️ Compra de <b>{esc_sym}</b> abortada: Saldo insuficiente o cantidad/valor mínimo no alcanzado. Saldo USDT: {latest_saldo_usdt:.2f}.")
             return None
 
         logging.info(
             f"Intentando COMPRA de {symbol} con cantidad: {final_cantidad_to_buy:.8f} (Saldo USDT justo antes: {latest_saldo_usdt:.2f})")
 
         # Ejecutar orden de compra a mercado.
+        # Respeta el límite de órdenes por segundo de Binance antes de enviar la orden.
+        binance_utils.esperar_orden()
         order = client.order_market_buy(
             symbol=symbol, quantity=final_cantidad_to_buy)
+        # La orden cambia los saldos: se invalida la caché para que la siguiente consulta sea real.
+        binance_utils.obtener_saldo_moneda.cache_clear()
 
         # Procesar la respuesta de la orden.
         if order and order['status'] == 'FILLED':
-            # Precio al que se ejecutó la orden.
-            precio_ejecucion = float(order['fills'][0]['price'])
-            # Cantidad real comprada.
-            cantidad_comprada_real = float(order['fills'][0]['qty'])
+            # Precio medio ponderado y cantidad real comprada sumando todas las ejecuciones (fills).
+            precio_ejecucion, cantidad_comprada_real = precio_medio_ejecucion(
+                order)
+            # Una sola marca de tiempo para la posición y la transacción de esta compra.
+            ahora_iso = _ahora_iso()
 
             # Registrar la nueva posición en el diccionario de posiciones abiertas del bot.
             posiciones_abiertas[symbol] = {
@@ -324,14 +823,14 @@ def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje,
                 # Bandera para el breakeven, inicialmente False.
                 'sl_moved_to_breakeven': False,
                 # Timestamp de apertura de la posición.
-                'timestamp_apertura': datetime.now().isoformat()
+                'timestamp_apertura': ahora_iso
             }
             # Guarda las posiciones (con debounce).
             position_manager.save_open_positions_debounced(posiciones_abiertas)
 
             # Registrar la transacción para el informe diario y Firestore.
             transaccion = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': ahora_iso,
                 'symbol': symbol,
                 'tipo': 'COMPRA',
                 'precio': precio_ejecucion,
@@ -341,23 +840,16 @@ def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje,
             # Añade a la lista de transacciones diarias.
             transacciones_diarias.append(transaccion)
 
-            # Guardar la transacción en Firestore.
-            db = firestore_utils.get_firestore_db()
-            if db:
-                try:
-                    db.collection(FIRESTORE_TRANSACTIONS_COLLECTION_PATH).add(
-                        transaccion)
-                    logging.info(
-                        f"✅ Transacción de COMPRA guardada en Firestore para {symbol}.")
-                except Exception as e:
-                    logging.error(
-                        f"❌ Error al guardar transacción de COMPRA en Firestore para {symbol}: {e}", exc_info=True)
-                    telegram_handler.send_telegram_message(
-                        telegram_bot_token, telegram_chat_id, f"❌ Error al guardar transacción de COMPRA en Firestore para {telegram_handler._escape_html_entities(symbol)}: {telegram_handler._escape_html_entities(e)}")
+            # Encola la transacción para guardarla en Firestore en segundo plano,
+            # sin bloquear la operación mientras se completa la escritura.
+            firestore_utils.encolar_documento(
+                FIRESTORE_TRANSACTIONS_COLLECTION_PATH, transaccion)
+            logging.info(
+                f"✅ Transacción de COMPRA encolada para Firestore para {symbol}.")
 
             # Envía notificación de compra exitosa a Telegram.
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"🟢 COMPRA de <b>{telegram_handler._escape_html_entities(symbol)}</b> ejecutada a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad: {cantidad_comprada_real:.6f}")
+                                                   f"🟢 COMPRA de <b>{esc_sym}</b> ejecutada a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad: {cantidad_comprada_real:.6f}")
             logging.info(
                 f"✅ COMPRA exitosa de {cantidad_comprada_real} {symbol} a {precio_ejecucion}")
             return order  # Retorna la respuesta de la orden de Binance.
@@ -367,21 +859,28 @@ def comprar(client, symbol, cantidad, posiciones_abiertas, stop_loss_porcentaje,
             if 'msg' in order:  # Algunos errores de Binance tienen un campo 'msg'
                 error_msg_content += f", Mensaje: {telegram_handler._escape_html_entities(order['msg'])}"
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"❌ Fallo al ejecutar COMPRA de <b>{telegram_handler._escape_html_entities(symbol)}</b>. {error_msg_content}")
+                                                   f"❌ Fallo al ejecutar COMPRA de <b>{esc_sym}</b>. {error_msg_content}")
             logging.error(
                 f"❌ Fallo al ejecutar COMPRA de {symbol}. Respuesta: {order}")
             return None  # Retorna None si la compra falló.
     except BinanceAPIException as e:
         # Captura errores específicos de la API de Binance.
         telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                               f"❌ Error de Binance API al intentar COMPRA de <b>{telegram_handler._escape_html_entities(symbol)}</b>: Código: {telegram_handler._escape_html_entities(str(e.code))}, Mensaje: {telegram_handler._escape_html_entities(e.message)}")
+                                               f"❌ Error de Binance API al intentar COMPRA de <b>{esc_sym}</b>: Código: {telegram_handler._escape_html_entities(str(e.code))}, Mensaje: {telegram_handler._escape_html_entities(e.message)}")
         logging.error(
             f"❌ Error en la función comprar para {symbol}: {e}", exc_info=True)
         return None  # Retorna None en caso de error.
+    except (BinanceRequestException, requests.exceptions.RequestException) as e:
+        # Captura errores de red o respuestas inválidas de Binance (la orden pudo no llegar a enviarse).
+        telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
+                                               f"❌ Error de red al intentar COMPRA de <b>{esc_sym}</b>: {telegram_handler._escape_html_entities(str(e))}")
+        logging.error(
+            f"❌ Error de red en la función comprar para {symbol}: {e}")
+        return None  # Retorna None en caso de error.
     except Exception as e:
-        # Captura cualquier otro error general durante el intento de compra.
+        # Último recurso: cualquier error inesperado no debe tumbar el bucle de trading.
         telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                               f"❌ Error general al intentar COMPRA de <b>{telegram_handler._escape_html_entities(symbol)}</b>: {telegram_handler._escape_html_entities(str(e))}")
+                                               f"❌ Error general al intentar COMPRA de <b>{esc_sym}</b>: {telegram_handler._escape_html_entities(str(e))}")
         logging.error(
             f"❌ Error en la función comprar para {symbol}: {e}", exc_info=True)
         return None  # Retorna None en caso de error.
@@ -410,20 +909,16 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
     Returns:
         dict or None: La respuesta de la orden de Binance si fue exitosa (total o parcial), None en caso contrario.
     """
-    base_asset = symbol.replace(
-        "USDT", "")  # Extrae el activo base (ej. BTC de BTCUSDT).
+    # Extrae el activo base (ej. BTC de BTCUSDT), memorizado por símbolo.
+    base_asset = binance_utils.activo_base(symbol)
+    # Símbolo escapado para HTML una sola vez (memorizado) para todas las notificaciones.
+    esc_sym = _esc_symbol(symbol)
 
     try:
-        # Obtener información del símbolo para verificar la cantidad mínima de la orden (minQty y minNotional).
-        info = client.get_symbol_info(symbol)
-        min_notional = 0.0  # Valor mínimo de la orden en USDT.
-        min_qty = 0.0  # Cantidad mínima de la moneda base.
-
-        for f in info['filters']:
-            if f['filterType'] == 'MIN_NOTIONAL':
-                min_notional = float(f['minNotional'])
-            elif f['filterType'] == 'LOT_SIZE':
-                min_qty = float(f['minQty'])
+        # Obtener los filtros del símbolo (cacheados) para verificar la cantidad mínima de la orden.
+        # min_notional: valor mínimo de la orden en USDT. min_qty: cantidad mínima de la moneda base.
+        step_size, min_qty, min_notional, _ = binance_utils.get_symbol_filters(
+            client, symbol)
 
         # Obtener el saldo real actual para este activo en la cuenta de Binance.
         saldo_real_activo = binance_utils.obtener_saldo_moneda(
@@ -431,54 +926,60 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
 
         # Ajustar la cantidad a vender al step_size de Binance para asegurar que la orden sea válida.
         cantidad_a_vender_ajustada = binance_utils.ajustar_cantidad(
-            saldo_real_activo, binance_utils.get_step_size(client, symbol))
+            saldo_real_activo, step_size)
 
         # Verificar si la cantidad ajustada es suficiente para una orden.
         if cantidad_a_vender_ajustada <= 0 or cantidad_a_vender_ajustada < min_qty:
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"⚠️ No hay <b>{telegram_handler._escape_html_entities(symbol)}</b> disponible para vender o la cantidad ({cantidad_a_vender_ajustada:.8f}) es demasiado pequeña (mínimo: {min_qty:.8f}).")
+                                                   f"⚠️ No hay <b>{esc_sym}</b> disponible para vender o la cantidad ({cantidad_a_vender_ajustada:.8f}) es demasiado pequeña (mínimo: {min_qty:.8f}).")
             logging.warning(
                 f"⚠️ No hay {symbol} disponible para vender o la cantidad ({cantidad_a_vender_ajustada:.8f}) es demasiado pequeña (mínimo: {min_qty:.8f}).")
 
             # Si la posición está en el registro del bot pero no hay saldo real, eliminarla para sincronizar.
-            if symbol in posiciones_abiertas:
-                del posiciones_abiertas[symbol]
-            # Guarda los cambios.
-            position_manager.save_open_positions_debounced(posiciones_abiertas)
-            logging.info(
-                f"Posición de {symbol} eliminada del registro interno debido a saldo insuficiente.")
+            # Solo se guarda si de verdad había una posición que eliminar.
+            if posiciones_abiertas.pop(symbol, None) is not None:
+                position_manager.save_open_positions_debounced(
+                    posiciones_abiertas)
+                logging.info(
+                    f"Posición de {symbol} eliminada del registro interno debido a saldo insuficiente.")
             return None
 
         # Verificar si el valor nocional (cantidad * precio) es suficiente.
         precio_actual = binance_utils.obtener_precio_actual(client, symbol)
         valor_nocional = cantidad_a_vender_ajustada * precio_actual
 
-        if valor_nocional < min_notional:
+        if not binance_utils.nocional_suficiente(cantidad_a_vender_ajustada, precio_actual, min_notional):
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"⚠️ El valor de venta de <b>{telegram_handler._escape_html_entities(symbol)}</b> ({valor_nocional:.2f} USDT) es inferior al mínimo nocional requerido ({min_notional:.2f} USDT). No se puede vender.")
+                                                   f"⚠️ El valor de venta de <b>{esc_sym}</b> ({valor_nocional:.2f} USDT) es inferior al mínimo nocional requerido ({min_notional:.2f} USDT). No se puede vender.")
             logging.warning(
                 f"⚠️ El valor de venta de {symbol} ({valor_nocional:.2f} USDT) es inferior al mínimo nocional requerido ({min_notional:.2f} USDT).")
 
             # Si la posición está en el registro del bot pero su valor es muy bajo, eliminarla.
-            if symbol in posiciones_abiertas:
-                del posiciones_abiertas[symbol]
-            # Guarda los cambios.
-            position_manager.save_open_positions_debounced(posiciones_abiertas)
-            logging.info(
-                f"Posición de {symbol} eliminada del registro interno debido a valor nocional insuficiente.")
+            # Solo se guarda si de verdad había una posición que eliminar.
+            if posiciones_abiertas.pop(symbol, None) is not None:
+                position_manager.save_open_positions_debounced(
+                    posiciones_abiertas)
+                logging.info(
+                    f"Posición de {symbol} eliminada del registro interno debido a valor nocional insuficiente.")
             return None
 
         # Ejecutar orden de venta a mercado.
+        # Respeta el límite de órdenes por segundo de Binance antes de enviar la orden.
+        binance_utils.esperar_orden()
         order = client.order_market_sell(
             symbol=symbol, quantity=cantidad_a_vender_ajustada)
+        # La orden cambia los saldos: se invalida la caché para que la siguiente consulta sea real.
+        binance_utils.obtener_saldo_moneda.cache_clear()
 
         # Procesar la respuesta de la orden.
         # Se considera exitosa si el estado es 'FILLED' (completada) o 'EXPIRED' con una cantidad ejecutada > 0 (parcialmente llenada).
         if order and (order['status'] == 'FILLED' or (order['status'] == 'EXPIRED' and float(order.get('executedQty', 0)) > 0)):
-            # Precio de la primera ejecución (se usa como precio promedio si hay múltiples fills).
-            precio_ejecucion = float(order['fills'][0]['price'])
+            # Precio medio ponderado de todas las ejecuciones (fills) de la orden.
+            precio_ejecucion, _ = precio_medio_ejecucion(order)
             # Cantidad total ejecutada (realmente vendida).
             cantidad_vendida_real = float(order['executedQty'])
+            # Una sola marca de tiempo para toda la venta (también las de vender_por_comando, que pasan por aquí).
+            ahora_iso = _ahora_iso()
 
             # Calcular beneficio/pérdida solo para la cantidad que realmente se vendió.
             # Se intenta obtener el precio de compra de la posición abierta.
@@ -502,10 +1003,10 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
 
             # Actualizar bot_params con el nuevo beneficio total.
             bot_params['TOTAL_BENEFICIO_ACUMULADO'] = total_beneficio_acumulado
-            logging.info(
-                f"DEBUG: TOTAL_BENEFICIO_ACUMULADO antes de guardar en config_manager: {bot_params['TOTAL_BENEFICIO_ACUMULADO']:.2f} USDT")
-            # Guardar los parámetros actualizados (persistencia).
-            config_manager.save_parameters(bot_params)
+            logging.debug("TOTAL_BENEFICIO_ACUMULADO antes de guardar en config_manager: %.2f USDT",
+                          bot_params['TOTAL_BENEFICIO_ACUMULADO'])
+            # Guardar los parámetros actualizados (persistencia diferida, agrupa ventas en ráfaga).
+            config_manager.save_parameters_debounced(bot_params)
 
             # Guarda las posiciones actualizadas (con debounce).
             position_manager.save_open_positions_debounced(posiciones_abiertas)
@@ -513,7 +1014,7 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
             # Registrar la transacción.
             transaccion = {
                 # Timestamp de la transacción.
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': ahora_iso,
                 'symbol': symbol,
                 'tipo': 'VENTA',
                 'precio': precio_ejecucion,
@@ -527,29 +1028,24 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
             # Añade a la lista de transacciones diarias.
             transacciones_diarias.append(transaccion)
 
-            # Guardar la transacción en Firestore.
-            db = firestore_utils.get_firestore_db()
-            if db:
-                try:
-                    db.collection(FIRESTORE_TRANSACTIONS_COLLECTION_PATH).add(
-                        transaccion)
-                    logging.info(
-                        f"✅ Transacción de VENTA guardada en Firestore para {symbol}.")
-                except Exception as e:
-                    logging.error(
-                        f"❌ Error al guardar transacción de VENTA en Firestore para {symbol}: {e}", exc_info=True)
-                    telegram_handler.send_telegram_message(
-                        telegram_bot_token, telegram_chat_id, f"❌ Error al guardar transacción de VENTA en Firestore para {telegram_handler._escape_html_entities(symbol)}: {telegram_handler._escape_html_entities(e)}")
+            # Encola la transacción para guardarla en Firestore en segundo plano,
+            # sin bloquear la operación mientras se completa la escritura.
+            firestore_utils.encolar_documento(
+                FIRESTORE_TRANSACTIONS_COLLECTION_PATH, transaccion)
+            logging.info(
+                f"✅ Transacción de VENTA encolada para Firestore para {symbol}.")
 
+            # Motivo escapado una sola vez para cualquiera de las dos notificaciones.
+            esc_mot = telegram_handler._escape_html_entities(motivo_venta)
             # Envía mensaje de Telegram más específico según el estado de la orden.
             if order['status'] == 'EXPIRED':
                 telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                       f"🟠 VENTA de <b>{telegram_handler._escape_html_entities(symbol)}</b> (PARCIAL/EXPIRADA) ejecutada por <b>{telegram_handler._escape_html_entities(motivo_venta)}</b> a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad vendida: {cantidad_vendida_real:.6f}. Ganancia: <b>{ganancia_usdt:.2f}</b> USDT.")
+                                                       f"🟠 VENTA de <b>{esc_sym}</b> (PARCIAL/EXPIRADA) ejecutada por <b>{esc_mot}</b> a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad vendida: {cantidad_vendida_real:.6f}. Ganancia: <b>{ganancia_usdt:.2f}</b> USDT.")
                 logging.info(
                     f"✅ VENTA PARCIAL/EXPIRADA exitosa de {cantidad_vendida_real} {symbol} a {precio_ejecucion} por {motivo_venta}. Ganancia: {ganancia_usdt:.2f} USDT")
             else:  # Estado 'FILLED'.
                 telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                       f"🔴 VENTA de <b>{telegram_handler._escape_html_entities(symbol)}</b> ejecutada por <b>{telegram_handler._escape_html_entities(motivo_venta)}</b> a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad: {cantidad_vendida_real:.6f}. Ganancia: <b>{ganancia_usdt:.2f}</b> USDT.")
+                                                       f"🔴 VENTA de <b>{esc_sym}</b> ejecutada por <b>{esc_mot}</b> a <b>{precio_ejecucion:.4f}</b> USDT. Cantidad: {cantidad_vendida_real:.6f}. Ganancia: <b>{ganancia_usdt:.2f}</b> USDT.")
                 logging.info(
                     f"✅ VENTA exitosa de {cantidad_vendida_real} {symbol} a {precio_ejecucion} por {motivo_venta}. Ganancia: {ganancia_usdt:.2f} USDT")
             return order  # Retorna la respuesta de la orden de Binance.
@@ -559,21 +1055,28 @@ def vender(client, symbol, cantidad_a_vender, posiciones_abiertas, total_benefic
             if 'msg' in order:  # Algunos errores de Binance tienen un campo 'msg'
                 error_msg_content += f", Mensaje: {telegram_handler._escape_html_entities(order['msg'])}"
             telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                                   f"❌ Fallo al ejecutar VENTA de <b>{telegram_handler._escape_html_entities(symbol)}</b>. {error_msg_content}")
+                                                   f"❌ Fallo al ejecutar VENTA de <b>{esc_sym}</b>. {error_msg_content}")
             logging.error(
                 f"❌ Fallo al ejecutar VENTA de {symbol}. Respuesta: {order}")
             return None  # Retorna None si la venta falló.
     except BinanceAPIException as e:
         # Captura errores específicos de la API de Binance.
         telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                               f"❌ Error de Binance API al intentar VENTA de <b>{telegram_handler._escape_html_entities(symbol)}</b>: Código: {telegram_handler._escape_html_entities(str(e.code))}, Mensaje: {telegram_handler._escape_html_entities(e.message)}")
+                                               f"❌ Error de Binance API al intentar VENTA de <b>{esc_sym}</b>: Código: {telegram_handler._escape_html_entities(str(e.code))}, Mensaje: {telegram_handler._escape_html_entities(e.message)}")
         logging.error(
             f"❌ Error en la función vender para {symbol}: {e}", exc_info=True)
         return None  # Retorna None en caso de error.
+    except (BinanceRequestException, requests.exceptions.RequestException) as e:
+        # Captura errores de red o respuestas inválidas de Binance (la orden pudo no llegar a enviarse).
+        telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
+                                               f"❌ Error de red al intentar VENTA de <b>{esc_sym}</b>: {telegram_handler._escape_html_entities(str(e))}")
+        logging.error(
+            f"❌ Error de red en la función vender para {symbol}: {e}")
+        return None  # Retorna None en caso de error.
     except Exception as e:
-        # Captura cualquier otro error general durante el intento de venta.
+        # Último recurso: cualquier error inesperado no debe tumbar el bucle de trading.
         telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                               f"❌ Error general al intentar VENTA de <b>{telegram_handler._escape_html_entities(symbol)}</b>: {telegram_handler._escape_html_entities(str(e))}")
+                                               f"❌ Error general al intentar VENTA de <b>{esc_sym}</b>: {telegram_handler._escape_html_entities(str(e))}")
         logging.error(
             f"❌ Error en la función vender para {symbol}: {e}", exc_info=True)
         return None  # Retorna None en caso de error.
@@ -599,18 +1102,24 @@ def vender_por_comando(client, symbol, posiciones_abiertas, transacciones_diaria
     Returns:
         dict or None: La respuesta de la orden de Binance si fue exitosa (total o parcial), None en caso contrario.
     """
+    # Símbolo escapado para HTML una sola vez (memorizado) para todas las notificaciones.
+    esc_sym = _esc_symbol(symbol)
     if symbol not in posiciones_abiertas:
         telegram_handler.send_telegram_message(
-            telegram_bot_token, telegram_chat_id, f"❌ No hay una posición abierta para <b>{telegram_handler._escape_html_entities(symbol)}</b> en el registro del bot.")
+            telegram_bot_token, telegram_chat_id, f"❌ No hay una posición abierta para <b>{esc_sym}</b> en el registro del bot.")
         return None  # Retorna None si no hay posición en el registro.
 
-    base_asset = symbol.replace("USDT", "")  # Extrae el activo base.
-    # Obtiene el saldo real del activo.
-    saldo_real_activo = binance_utils.obtener_saldo_moneda(client, base_asset)
+    base_asset = binance_utils.activo_base(symbol)  # Extrae el activo base.
+    # Saldo real del activo, filtros del símbolo y precio actual son consultas independientes:
+    # se lanzan a la vez en lugar de una tras otra.
+    saldo_real_activo, filtros, precio_actual = binance_utils.consultar_en_paralelo(
+        (binance_utils.obtener_saldo_moneda, client, base_asset),
+        (binance_utils.get_symbol_filters, client, symbol),
+        (binance_utils.obtener_precio_actual, client, symbol))
 
     if saldo_real_activo <= 0:
         telegram_handler.send_telegram_message(
-            telegram_bot_token, telegram_chat_id, f"❌ No hay saldo de <b>{telegram_handler._escape_html_entities(symbol)}</b> en tu cuenta de Binance para vender.")
+            telegram_bot_token, telegram_chat_id, f"❌ No hay saldo de <b>{esc_sym}</b> en tu cuenta de Binance para vender.")
         # Eliminar la posición del registro del bot si el saldo real es cero.
         if symbol in posiciones_abiertas:
             del posiciones_abiertas[symbol]
@@ -621,25 +1130,16 @@ def vender_por_comando(client, symbol, posiciones_abiertas, transacciones_diaria
         return None  # Retorna None si no hay saldo para vender.
 
     # Ajustar la cantidad a vender al step_size de Binance.
+    step_size, min_qty, min_notional, _ = filtros
     cantidad_a_vender_ajustada = binance_utils.ajustar_cantidad(
-        saldo_real_activo, binance_utils.get_step_size(client, symbol))
+        saldo_real_activo, step_size)
 
     # Verificar si la cantidad ajustada es suficiente para una orden (minQty y minNotional).
-    info = client.get_symbol_info(symbol)
-    min_notional = 0.0
-    min_qty = 0.0
-    for f in info['filters']:
-        if f['filterType'] == 'MIN_NOTIONAL':
-            min_notional = float(f['minNotional'])
-        elif f['filterType'] == 'LOT_SIZE':
-            min_qty = float(f['minQty'])
-
-    precio_actual = binance_utils.obtener_precio_actual(client, symbol)
     valor_nocional = cantidad_a_vender_ajustada * precio_actual
 
-    if cantidad_a_vender_ajustada <= 0 or cantidad_a_vender_ajustada < min_qty or valor_nocional < min_notional:
+    if not binance_utils.cumple_filtros(cantidad_a_vender_ajustada, precio_actual, min_qty, min_notional):
         telegram_handler.send_telegram_message(telegram_bot_token, telegram_chat_id,
-                                               f"⚠️ La cantidad de <b>{telegram_handler._escape_html_entities(symbol)}</b> disponible ({cantidad_a_vender_ajustada:.8f}) o su valor ({valor_nocional:.2f} USDT) es demasiado pequeña para una orden de venta. Mínimo nocional: {min_notional:.2f} USDT, Mínimo cantidad: {min_qty:.8f}.")
+                                               f"⚠️ La cantidad de <b>{esc_sym}</b> disponible ({cantidad_a_vender_ajustada:.8f}) o su valor ({valor_nocional:.2f} USDT) es demasiado pequeña para una orden de venta. Mínimo nocional: {min_notional:.2f} USDT, Mínimo cantidad: {min_qty:.8f}.")
         logging.warning(
             f"⚠️ La cantidad de {symbol} disponible ({cantidad_a_vender_ajustada:.8f}) o su valor ({valor_nocional:.2f} USDT) es demasiado pequeña para una orden de venta.")
         # Eliminar la posición del registro del bot si la cantidad es muy pequeña para vender.
@@ -652,9 +1152,10 @@ def vender_por_comando(client, symbol, posiciones_abiertas, transacciones_diaria
         return None  # Retorna None si la cantidad es insuficiente.
 
     telegram_handler.send_telegram_message(
-        telegram_bot_token, telegram_chat_id, f"⚙️ Intentando vender <b>{telegram_handler._escape_html_entities(symbol)}</b> por comando...")
+        telegram_bot_token, telegram_chat_id, f"⚙️ Intentando vender <b>{esc_sym}</b> por comando...")
 
-    # Reutilizar la función vender principal para ejecutar la venta.
+    # Reutilizar la función vender principal para ejecutar la venta: la marca de tiempo de la
+    # transacción se calcula una sola vez allí, igual que en las ventas automáticas.
     orden = vender(
         client, symbol, cantidad_a_vender_ajustada, posiciones_abiertas,
         total_beneficio_acumulado, bot_params, transacciones_diarias,